@@ -0,0 +1,36 @@
+"""integer primary keys for sqlite autoincrement
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+# В SQLite только столбец INTEGER PRIMARY KEY получает id автоматически,
+# BIGINT PRIMARY KEY остаётся обычным столбцом
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in ('quizzes', 'stats'):
+        with op.batch_alter_table(table, recreate='always') as batch_op:
+            batch_op.alter_column('id', existing_type=sa.BigInteger(), type_=sa.Integer(),
+                                  existing_nullable=False, autoincrement=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in ('quizzes', 'stats'):
+        with op.batch_alter_table(table, recreate='always') as batch_op:
+            batch_op.alter_column('id', existing_type=sa.Integer(), type_=sa.BigInteger(),
+                                  existing_nullable=False, autoincrement=True)
@@ -1,35 +1,27 @@
+# Imported first: the startup timing report counts the import phase from here
+from bot.utils import startup
 import asyncio
+import logging
 import os
-
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.utils.callback_answer import CallbackAnswerMiddleware
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from functools import partial
 
 from bot import config
-from bot.handlers import commands, callbacks
-from bot.middlewares import DbSessionMiddleware
+from bot.app import create_bot, create_dispatcher
 from bot.ui_commands import set_ui_commands
 
 
 async def main():
-    engine = create_async_engine(url=config.db_url, echo=False)
-    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
-
-    bot = Bot(config.bot_token, default=DefaultBotProperties(parse_mode='HTML'))
-
-    # Setup dispatcher and bind routers to it
-    dp = Dispatcher()
-    dp.update.middleware(DbSessionMiddleware(session_pool=sessionmaker))
-    # Automatically reply to all callbacks
-    dp.callback_query.middleware(CallbackAnswerMiddleware())
-
-    # Register handlers
-    dp.include_router(commands.router)
-    dp.include_router(callbacks.router)
+    startup.mark("import")
+    bot = create_bot()
+    dp = await create_dispatcher()
 
-    # Set bot commands in UI
+    # Set bot commands in UI, unless they have not changed since the last start
     await set_ui_commands(bot)
+    # Polling needs the bot user anyway; fetching it here counts it in the API phase
+    await bot.me()
+    startup.mark("api")
+    # Registered last, so the report is logged once all startup hooks have run
+    dp.startup.register(partial(startup.report, "hooks"))
 
     # Run bot
     await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
@@ -38,4 +30,10 @@ async def main():
 if __name__ == "__main__":
     if os.name == "nt":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(main())
+    if config.run_mode == "webhook":
+        from bot.webhook import run_webhook
+        run_webhook()
+    else:
+        logging.basicConfig(level=logging.WARNING)
+        logging.getLogger(startup.__name__).setLevel(logging.INFO)
+        asyncio.run(main())
@@ -0,0 +1,111 @@
+from functools import partial
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.utils.callback_answer import CallbackAnswerMiddleware
+
+from bot import config
+from bot.db.engine import create_sessionmaker, create_state_sessionmaker, dispose
+from bot.db.models import Stat, AnswerEvent
+from bot.db.writer import BatchWriter
+from bot.handlers import commands, callbacks, live
+from bot.middlewares import DbSessionMiddleware, UpdateMetricsMiddleware, HandlerMetricsMiddleware, \
+    BotApiMetricsMiddleware
+from bot.storage import MemoryStateStore, SqliteStateStore, StoreFsmStorage
+from bot.utils import run_state, rendering, analytics, deadlines, metrics, outbound, quiz_cache, startup
+from bot.utils import live as live_state
+
+
+def create_bot() -> Bot:
+    # All Bot API calls share one connection pool.
+    # A local Bot API server (or a fake one for testing) can be used instead of api.telegram.org
+    session = AiohttpSession(limit=config.bot_api_connections)
+    if config.bot_api_url:
+        session.api = TelegramAPIServer.from_base(config.bot_api_url)
+    bot = Bot(config.bot_token, session=session, default=DefaultBotProperties(parse_mode='HTML'))
+    # Sends wait in the prioritized outbound queue; registered first so that metrics time only the API call
+    bot.session.middleware(outbound.queue)
+    bot.session.middleware(BotApiMetricsMiddleware())
+    return bot
+
+
+async def create_dispatcher() -> Dispatcher:
+    # With SQLite in WAL mode writes share one connection and reads use a separate pool
+    sessionmaker = create_sessionmaker()
+
+    # Results are written to the DB in batches by a background task
+    stat_writer = BatchWriter(sessionmaker, Stat, config.stat_batch_size, config.stat_flush_interval)
+    # Every single answer goes to the append-only event log the same way
+    answer_writer = BatchWriter(sessionmaker, AnswerEvent, config.answer_batch_size, config.answer_flush_interval)
+
+    # Running quizzes and FSM data survive restarts when stored in SQLite
+    # The store reads through its own connections so that a handler holding a pooled one never waits on the pool
+    state_sessionmaker = create_state_sessionmaker(sessionmaker)
+    if config.state_backend == "sqlite":
+        state_store = SqliteStateStore(state_sessionmaker, config.state_flush_interval, config.state_cache_size)
+    else:
+        state_store = MemoryStateStore()
+    await state_store.start()
+    await run_state.restore(state_store)
+    await live_state.restore()
+    startup.mark("db")
+
+    # Open and running quizzes are compiled before the first answer arrives
+    async with sessionmaker() as session:
+        await quiz_cache.prewarm(session, set(run_state.current_quizzes) |
+                                 {state["quiz_id"] for state in live_state.chats.values()})
+    startup.mark("prewarm")
+
+    # Setup dispatcher and bind routers to it
+    dp = Dispatcher(storage=StoreFsmStorage(state_store), stat_writer=stat_writer, answer_writer=answer_writer,
+                    session_pool=sessionmaker)
+    # Question deadlines stop before the writers so that expired questions are still logged
+    dp.startup.register(commands.start_deadlines)
+    dp.shutdown.register(deadlines.stop)
+    dp.startup.register(stat_writer.start)
+    dp.startup.register(answer_writer.start)
+    # Flush pending results before exit
+    dp.shutdown.register(stat_writer.stop)
+    dp.shutdown.register(answer_writer.stop)
+    # Per-question counters are updated in memory and snapshotted to the state store
+    dp.startup.register(partial(analytics.start, config.analytics_snapshot_interval))
+    dp.shutdown.register(analytics.stop)
+    # Images are rendered in a process pool so that PIL does not block the event loop
+    dp.startup.register(partial(rendering.start, config.render_workers, config.render_max_pending))
+    dp.shutdown.register(rendering.stop)
+    # Metrics are served in Prometheus format on a local port
+    metrics.track_queries()
+    metrics.Gauge("quiz_writer_queue", "Rows waiting to be written to the DB", lambda: {
+        (writer.model.__tablename__,): writer.queue.qsize() for writer in (stat_writer, answer_writer)
+    }, ("table",))
+    dp.startup.register(metrics.start)
+    dp.shutdown.register(metrics.stop)
+    # Teacher notifications still waiting to be merged are sent before the session is closed
+    dp.shutdown.register(outbound.stop)
+    # Registered before the DB session so that its opening and closing are timed too
+    dp.update.middleware(UpdateMetricsMiddleware())
+    dp.update.middleware(DbSessionMiddleware(session_pool=sessionmaker))
+    # Automatically reply to all callbacks
+    dp.callback_query.middleware(CallbackAnswerMiddleware())
+
+    # Registered last so that the shutdown hooks above can still write to the state store
+    dp.shutdown.register(state_store.close)
+    dp.shutdown.register(partial(dispose, state_sessionmaker))
+    dp.shutdown.register(partial(dispose, sessionmaker))
+
+    include_routers(dp)
+    handler_metrics = HandlerMetricsMiddleware()
+    for update_type, observer in dp.observers.items():
+        if update_type not in ("update", "error"):
+            observer.middleware(handler_metrics)
+    return dp
+
+
+def include_routers(dp: Dispatcher):
+    # Register handlers
+    # Group-chat quizzes first: the generic poll answer handler in commands would swallow their answers
+    dp.include_router(live.router)
+    dp.include_router(commands.router)
+    dp.include_router(callbacks.router)
@@ -19,3 +19,27 @@ class InviteQuizCallbackData(CallbackData, prefix="invite_quiz"):
 
 class StatsQuizCallbackData(CallbackData, prefix="stats_quiz"):
     quiz_id: int
+
+
+class VerboseQuizCallbackData(CallbackData, prefix="verbose_quiz"):
+    quiz_id: int
+
+
+class AnalyticsQuizCallbackData(CallbackData, prefix="analytics_quiz"):
+    quiz_id: int
+
+
+class ExportQuizCallbackData(CallbackData, prefix="export_quiz"):
+    quiz_id: int
+    format: str = ""
+
+
+class LiveQuizCallbackData(CallbackData, prefix="live_quiz"):
+    # next - к следующему вопросу, stop - завершить викторину
+    action: str
+
+
+class StatsPageCallbackData(CallbackData, prefix="stats_page"):
+    quiz_id: int
+    after: int = 0
+    before: int = 0
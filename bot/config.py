@@ -1,3 +1,91 @@
 bot_token = ""
 db_url = "sqlite+aiosqlite:///database.db"
+# Режим SQLite: "wal" - WAL, одно соединение для записи и пул соединений для чтения;
+# "default" - одно обычное подключение, как раньше
+sqlite_mode = "wal"
+sqlite_read_pool_size = 4
+# Сколько соединений для чтения можно открыть сверх пула при наплыве; больше - запросы ждут свободного
+sqlite_read_max_overflow = 28
+# Сколько ждать освобождения базы другим процессом, в миллисекундах
+sqlite_busy_timeout = 5000
+sqlite_cache_size_kb = 32 * 1024
 admin_ids = [447617282]
+
+# Кэш разобранных викторин
+quiz_cache_size = 256
+quiz_cache_ttl = 6 * 60 * 60
+
+# Очередь исходящих сообщений: общий лимит бота (Telegram: ~30 сообщений в секунду) и сколько запросов
+# каждого приоритета может ждать отправки; под нагрузкой стикеры отбрасываются, а студенты обслуживаются первыми
+outbound_rate = 30
+outbound_max_questions = 10000
+outbound_max_teacher = 1000
+outbound_max_decorations = 100
+# Стикер, который ждал отправки дольше этого, в секундах, отбрасывается
+outbound_decoration_max_wait = 2
+outbound_max_attempts = 5
+# Соединений с Bot API в общем пуле
+bot_api_connections = 64
+# Уведомления преподавателю о каждом ответе, накопившиеся за это время, в секундах, уходят одним сообщением;
+# если их больше notify_max_pending, самые старые отбрасываются
+notify_interval = 1
+notify_max_pending = 200
+
+# Лимиты рассылки (Telegram: ~1 сообщение в секунду в один чат)
+broadcast_chat_rate = 1
+broadcast_concurrency = 50
+# Как часто обновлять сообщение о ходе рассылки, в секундах
+broadcast_progress_interval = 2
+
+# Как часто обновлять сводку по викторине у преподавателя, в секундах
+scoreboard_interval = 3
+
+# Фоновая запись результатов в базу
+stat_batch_size = 500
+stat_flush_interval = 0.5
+# То же для журнала всех ответов
+answer_batch_size = 1000
+answer_flush_interval = 1
+# Как часто сохранять статистику по вопросам, в секундах
+analytics_snapshot_interval = 10
+
+# Импорт викторин из файла
+import_max_file_size = 20 * 1024 * 1024
+import_max_questions = 5000
+
+# Хранилище состояния идущих викторин и FSM: "sqlite" или "memory"
+state_backend = "sqlite"
+state_flush_interval = 0.2
+# Сколько последних ключей хранилища держать в памяти
+state_cache_size = 50000
+
+# Режим работы: "polling" или "webhook" (несколько процессов-обработчиков)
+run_mode = "polling"
+webhook_url = ""
+webhook_path = "/webhook"
+webhook_host = "0.0.0.0"
+webhook_port = 8080
+webhook_secret = ""
+webhook_workers = 4
+# Сколько секунд ждать ответа других процессов-обработчиков (например, числа их участников викторины)
+shard_reply_timeout = 2
+# Адрес своего (или тестового) Bot API сервера, None - api.telegram.org
+bot_api_url = None
+
+# Сколько готовых QR-кодов приглашений держать в памяти
+qr_cache_size = 256
+
+# Пул процессов для отрисовки изображений и сколько задач в нём может ждать
+render_workers = 2
+render_max_pending = 100
+
+# Строк на странице статистики
+stats_page_size = 25
+
+# Сколько ещё ждать ответа на опрос с ограничением времени после его закрытия, в секундах
+poll_deadline_grace = 2
+
+# Метрики в формате Prometheus: http://metrics_host:metrics_port/metrics, None - не запускать.
+# В режиме webhook процесс-обработчик номер N слушает порт metrics_port + N
+metrics_host = "127.0.0.1"
+metrics_port = 9464
@@ -1,8 +1,12 @@
 from .base import Base
-from .models import Quiz
+from .models import Quiz, Question, QuestionOption, QuizRun, AnswerEvent
 
 __all__ = [
     "Base",
-    "Quiz"
+    "Quiz",
+    "Question",
+    "QuestionOption",
+    "QuizRun",
+    "AnswerEvent"
 ]
 
@@ -0,0 +1,104 @@
+from sqlalchemy import event, Insert, Update, Delete
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from bot import config
+
+
+def _set_pragmas(engine, pragmas: dict):
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+class RoutingSession(Session):
+    """
+    Сессия с двумя базами: запросы на чтение идут в пул читающих соединений, всё остальное - в единственное
+    пишущее соединение. После первой записи и до конца транзакции сессия читает тоже через пишущее соединение,
+    чтобы видеть свои незакоммиченные изменения
+    """
+
+    writer = None
+    reader = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            self.info["wrote"] = True
+        if self.info.get("wrote"):
+            return self.writer.sync_engine
+        return self.reader.sync_engine
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _reset_writes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("wrote", None)
+
+
+def _create_reader(url, pool_size: int, max_overflow: int):
+    reader = create_async_engine(url=url, echo=False, pool_size=pool_size, max_overflow=max_overflow,
+                                 pool_timeout=60)
+    _set_pragmas(reader, {
+        "query_only": "ON",
+        "busy_timeout": config.sqlite_busy_timeout,
+        "cache_size": -config.sqlite_cache_size_kb,
+        "temp_store": "MEMORY",
+    })
+    return reader
+
+
+def create_sessionmaker() -> async_sessionmaker:
+    """
+    Создаёт движок по config.db_url. Для файла SQLite в режиме "wal" включает WAL и создаёт два движка:
+    одно соединение для записи (записи из разных задач выстраиваются в очередь к нему, а не упираются
+    в блокировку базы) и пул соединений только для чтения
+    """
+    url = make_url(config.db_url)
+    file_database = url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+    if config.sqlite_mode != "wal" or not file_database:
+        return async_sessionmaker(create_async_engine(url=url, echo=False), expire_on_commit=False)
+
+    writer = create_async_engine(url=url, echo=False, pool_size=1, max_overflow=0, pool_timeout=60)
+    _set_pragmas(writer, {
+        "journal_mode": "WAL",
+        # В режиме WAL при synchronous=NORMAL коммит не ждёт fsync, база остаётся целой при сбое питания
+        "synchronous": "NORMAL",
+        "busy_timeout": config.sqlite_busy_timeout,
+        "cache_size": -config.sqlite_cache_size_kb,
+        "temp_store": "MEMORY",
+    })
+    # Обработчик держит своё соединение, пока ждёт ответа Telegram, поэтому при наплыве студентов пула мало:
+    # сверх него открывается до sqlite_read_max_overflow соединений, остальные запросы ждут свободного
+    reader = _create_reader(url, config.sqlite_read_pool_size, config.sqlite_read_max_overflow)
+
+    session_class = type("SqliteRoutingSession", (RoutingSession,), {"writer": writer, "reader": reader})
+    return async_sessionmaker(sync_session_class=session_class, expire_on_commit=False)
+
+
+def create_state_sessionmaker(session_pool: async_sessionmaker) -> async_sessionmaker:
+    """
+    Сессии для хранилища состояния: пишут через то же соединение, что session_pool, а читают через
+    свой маленький пул. Обработчик читает состояние FSM, уже держа соединение из общего пула для чтения;
+    если бы хранилище брало второе соединение оттуда же, при наплыве студентов обработчики заняли бы весь
+    пул и ждали друг друга. Без WAL возвращает session_pool
+    """
+    session_class = session_pool.kw.get("sync_session_class")
+    if session_class is None or not issubclass(session_class, RoutingSession):
+        return session_pool
+    # Запросы хранилища не вкладываются друг в друга и короткие, им хватает двух соединений
+    reader = _create_reader(session_class.reader.url, pool_size=2, max_overflow=0)
+    state_class = type("SqliteStateSession", (RoutingSession,), {"writer": session_class.writer, "reader": reader})
+    return async_sessionmaker(sync_session_class=state_class, expire_on_commit=False)
+
+
+async def dispose(session_pool: async_sessionmaker):
+    session_class = session_pool.kw.get("sync_session_class")
+    if session_class is not None and issubclass(session_class, RoutingSession):
+        await session_class.writer.dispose()
+        await session_class.reader.dispose()
+    elif session_pool.kw.get("bind") is not None:
+        await session_pool.kw["bind"].dispose()
@@ -1,28 +1,120 @@
-from sqlalchemy import BigInteger, String, Boolean
-from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+
+from sqlalchemy import BigInteger, String, Boolean, Integer, Index, ForeignKey, UniqueConstraint, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from bot.db.base import Base
 
+# В SQLite автоинкремент работает только для INTEGER PRIMARY KEY
+BigIntegerId = BigInteger().with_variant(Integer, "sqlite")
+
 
 class Quiz(Base):
     __tablename__ = "quizzes"
 
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, unique=True, autoincrement=True)
+    id: Mapped[int] = mapped_column(BigIntegerId, primary_key=True, unique=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String, nullable=True)
     user_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
-    json: Mapped[str] = mapped_column(String, nullable=True)
     active: Mapped[bool] = mapped_column(Boolean, nullable=True)
+    # Число вопросов, чтобы не считать их на каждом шаге викторины
+    question_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
 
     def __repr__(self) -> str:
-        return f"Quiz(id={self.id!r}, name={self.name!r}, user_id={self.user_id!r}, json={self.json!r}, active={self.active!r})"
+        return f"Quiz(id={self.id!r}, name={self.name!r}, user_id={self.user_id!r}, active={self.active!r}, question_count={self.question_count!r})"
+
+
+class Question(Base):
+    __tablename__ = "questions"
+
+    id: Mapped[int] = mapped_column(BigIntegerId, primary_key=True, autoincrement=True)
+    quiz_id: Mapped[int] = mapped_column(ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False)
+    # Номер вопроса в викторине, с нуля
+    position: Mapped[int] = mapped_column(Integer, nullable=False)
+    type: Mapped[str] = mapped_column(String, nullable=False)
+    text: Mapped[str] = mapped_column(String, nullable=False)
+    # Правильный ответ для вопросов с письменным ответом
+    answer: Mapped[str] = mapped_column(String, nullable=True)
+    # file_id картинки к вопросу
+    photo: Mapped[str] = mapped_column(String, nullable=True)
+    # Время на ответ в секундах; None - без ограничения
+    time_limit: Mapped[int] = mapped_column(Integer, nullable=True)
+
+    options: Mapped[list["QuestionOption"]] = relationship(order_by="QuestionOption.position",
+                                                           cascade="all, delete-orphan", lazy="raise")
+
+    __table_args__ = (
+        UniqueConstraint("quiz_id", "position", name="uq_questions_quiz_position"),
+    )
+
+
+class QuestionOption(Base):
+    __tablename__ = "question_options"
+
+    id: Mapped[int] = mapped_column(BigIntegerId, primary_key=True, autoincrement=True)
+    question_id: Mapped[int] = mapped_column(ForeignKey("questions.id", ondelete="CASCADE"), nullable=False)
+    position: Mapped[int] = mapped_column(Integer, nullable=False)
+    text: Mapped[str] = mapped_column(String, nullable=False)
+    is_correct: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        UniqueConstraint("question_id", "position", name="uq_question_options_question_position"),
+    )
 
 
 class Stat(Base):
     __tablename__ = "stats"
 
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, unique=True, autoincrement=True)
+    id: Mapped[int] = mapped_column(BigIntegerId, primary_key=True, unique=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String, nullable=True)
     user_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
     quiz_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
     correct_count: Mapped[int] = mapped_column(BigInteger, nullable=True)
     total_questions: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    # Имя и номер группы, которые ввёл студент, отдельно от HTML в name; 0 - группа не указана
+    display_name: Mapped[str] = mapped_column(String, nullable=False, server_default="")
+    group_number: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
+    # Порядок отчёта по викторине: группа, имя, id
+    __table_args__ = (
+        Index("ix_stats_quiz_group_name", "quiz_id", "group_number", "display_name", "id"),
+    )
+
+
+class StateEntry(Base):
+    __tablename__ = "state"
+
+    namespace: Mapped[str] = mapped_column(String, primary_key=True)
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[str] = mapped_column(String, nullable=False)
+
+
+class QuizRun(Base):
+    """Одно проведение викторины: от нажатия "начать" до остановки"""
+    __tablename__ = "quiz_runs"
+
+    id: Mapped[int] = mapped_column(BigIntegerId, primary_key=True, autoincrement=True)
+    quiz_id: Mapped[int] = mapped_column(ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False, index=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+
+class AnswerEvent(Base):
+    """Каждый ответ студента; записи только добавляются"""
+    __tablename__ = "answer_events"
+
+    id: Mapped[int] = mapped_column(BigIntegerId, primary_key=True, autoincrement=True)
+    run_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    quiz_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    user_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    question_index: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Выбранные варианты (JSON-список номеров) или текст письменного ответа
+    options: Mapped[str] = mapped_column(String, nullable=True)
+    text: Mapped[str] = mapped_column(String, nullable=True)
+    is_correct: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    # Время от отправки вопроса до ответа; None, если вопрос отправлен до перезапуска бота
+    latency_ms: Mapped[int] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_answer_events_run_question", "run_id", "question_index"),
+        Index("ix_answer_events_quiz_question", "quiz_id", "question_index"),
+    )
@@ -0,0 +1,67 @@
+# Чтение и запись вопросов викторины; вопрос читается по одному, без загрузки всей викторины
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from bot.db.models import Quiz, Question, QuestionOption
+
+
+def question_to_dict(question: Question) -> dict:
+    """Вопрос в том виде, в каком его создаёт диалог и импорт: type, question, options, correct, photo, time_limit"""
+    data = {
+        "type": question.type,
+        "question": question.text,
+        "options": [option.text for option in question.options],
+        "correct": question.answer if question.type == "written" else
+        [option.position for option in question.options if option.is_correct]
+    }
+    if question.photo:
+        data["photo"] = question.photo
+    if question.time_limit:
+        data["time_limit"] = question.time_limit
+    return data
+
+
+def question_from_dict(position: int, data: dict) -> Question:
+    correct = data.get("correct")
+    question = Question(
+        position=position,
+        type=data["type"],
+        text=data["question"],
+        answer=correct if data["type"] == "written" else None,
+        photo=data.get("photo"),
+        time_limit=data.get("time_limit")
+    )
+    if data["type"] == "multiple_choice":
+        correct = set(correct or [])
+        question.options = [
+            QuestionOption(position=i, text=text, is_correct=i in correct)
+            for i, text in enumerate(data.get("options") or [])
+        ]
+    else:
+        question.options = []
+    return question
+
+
+async def add_questions(session: AsyncSession, quiz: Quiz, questions: list):
+    """Добавляет вопросы к новой викторине; викторина должна быть уже добавлена в сессию"""
+    await session.flush()
+    quiz.question_count = len(questions)
+    for position, data in enumerate(questions):
+        question = question_from_dict(position, data)
+        question.quiz_id = quiz.id
+        session.add(question)
+
+
+async def get_question(session: AsyncSession, quiz_id: int, index: int):
+    """Возвращает вопрос номер index (с нуля) или None"""
+    query = select(Question).filter_by(quiz_id=quiz_id, position=index).options(selectinload(Question.options))
+    question = (await session.execute(query)).scalar()
+    return None if question is None else question_to_dict(question)
+
+
+async def get_questions(session: AsyncSession, quiz_id: int) -> list:
+    """Возвращает все вопросы викторины по порядку"""
+    query = select(Question).filter_by(quiz_id=quiz_id).order_by(Question.position) \
+        .options(selectinload(Question.options))
+    return [question_to_dict(question) for question in (await session.execute(query)).scalars()]
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """Копит строки в памяти и пишет их в базу пачками из фоновой задачи"""
+
+    def __init__(self, session_pool: async_sessionmaker, model, batch_size: int, flush_interval: float,
+                 max_attempts: int = 3):
+        self.session_pool = session_pool
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.queue = asyncio.Queue()
+        self._task = None
+
+    def put(self, **values):
+        """Ставит строку в очередь на запись, не дожидаясь базы"""
+        self.queue.put_nowait(values)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописывает всё, что осталось в очереди, и останавливает фоновую задачу"""
+        if self._task is None:
+            return
+        self.queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [await self.queue.get()]
+            if batch[0] is not None:
+                # Даём накопиться строкам, чтобы записать их одним запросом
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if None in batch:
+                stopping = True
+                batch = [row for row in batch if row is not None]
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch: list):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with self.session_pool() as session:
+                    await session.execute(insert(self.model), batch)
+                    await session.commit()
+                return
+            except Exception:
+                logger.exception("Failed to write %s rows to %s (attempt %s)",
+                                 len(batch), self.model.__tablename__, attempt)
+                await asyncio.sleep(attempt)
+        # Оставляем строки в логе, чтобы их можно было восстановить вручную
+        logger.error("Dropped rows for %s: %r", self.model.__tablename__, batch)
@@ -1,6 +1,13 @@
+import asyncio
+import html
 import json
+import os
+import tempfile
+import time
+from functools import partial
 
-from aiogram import Router, F, Bot
+from aiogram import Router, F, Bot, Dispatcher
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart, CommandObject, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
@@ -8,22 +15,28 @@ from aiogram.types import Message, CallbackQuery, PollAnswer, User, FSInputFile
 from aiogram.utils.deep_linking import create_start_link
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.utils.payload import decode_payload
-from sqlalchemy import select, func
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot import config, sharding
 from bot.common import SelectQuizCallbackData, StartQuizCallbackData, StopQuizCallbackData, InviteQuizCallbackData, \
-    StatsQuizCallbackData
-from bot.db import Quiz
-from bot.db.models import Stat
-from bot.keyboards import generate_main_menu, generate_my_quizzes, generate_my_quiz
-from bot.utils.qrcode_api import generate_qr_code
+    StatsQuizCallbackData, VerboseQuizCallbackData, StatsPageCallbackData, AnalyticsQuizCallbackData, \
+    ExportQuizCallbackData
+from bot.db import Quiz, QuizRun
+from bot.db import questions as question_repository
+from bot.db.writer import BatchWriter
+from bot.keyboards import generate_main_menu, generate_my_quizzes, generate_my_quiz, generate_stats_pages, \
+    generate_export_formats
+from bot.utils import routing, quiz_cache, scoreboard, quiz_import, run_state, media, stats_report, analytics, \
+    export, deadlines, outbound
+from bot.utils.broadcast import broadcaster
+from bot.utils.qrcode_api import qr_code_png, qr_key
+from bot.utils.run_state import current_quizzes, temporary_quiz_data, usernames
 
 router = Router(name="commands-router")
 
-current_quizzes = {}
-temporary_quiz_data = {}
-
-usernames = {}
+# quiz_id -> ссылка-приглашение
+invite_links = {}
 
 
 def get_clickable_name(user: User):
@@ -46,7 +59,7 @@ class QuizParticipation(StatesGroup):
 
 @router.message(CommandStart())
 async def cmd_start(message: Message, session: AsyncSession, command: CommandObject, state: FSMContext):
-    await message.bot.send_sticker(message.from_user.id, sticker=FSInputFile("sticker.tgs"))
+    await outbound.decoration(media.send_asset(message.bot, message.from_user.id, "sticker", "sticker.tgs"))
     quiz_id = 0
     try:
         quiz_id = int(decode_payload(command.args))
@@ -63,8 +76,7 @@ async def cmd_start(message: Message, session: AsyncSession, command: CommandObj
             return
 
         # Добавляем студента в список участников викторины
-        if quiz_id not in current_quizzes:
-            current_quizzes[quiz_id] = {"participants": {}}
+        run_state.open_quiz(quiz_id)
 
         # Сохраняем quiz_id в FSM
         await state.update_data(quiz_id=quiz_id)
@@ -86,6 +98,7 @@ class QuizCreation(StatesGroup):
     waiting_for_question_type = State()
     waiting_for_question_options = State()
     waiting_for_correct_answer = State()
+    waiting_for_time_limit = State()
 
 
 # Начало создания викторины
@@ -93,7 +106,7 @@ class QuizCreation(StatesGroup):
 async def my_quizzes(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     db_query = await session.execute(select(Quiz).filter_by(user_id=callback.from_user.id).order_by(Quiz.id))
     quizzes = db_query.scalars().all()
-    await callback.bot.send_sticker(callback.from_user.id, sticker=FSInputFile("sticker.tgs"))
+    await outbound.decoration(media.send_asset(callback.bot, callback.from_user.id, "sticker", "sticker.tgs"))
     await callback.message.answer("Ваши викторины:", reply_markup=generate_my_quizzes(quizzes))
 
 
@@ -135,22 +148,20 @@ async def start_my_quiz(callback: CallbackQuery, callback_data: StartQuizCallbac
     await session.commit()
 
     # Проверяем, есть ли участники
-    if quiz.id not in current_quizzes or not current_quizzes[quiz.id]["participants"]:
+    participants_count = await run_state.count_participants(quiz.id)
+    if not participants_count:
         await callback.message.answer("Нет участников для начала викторины.")
         return
 
-    # Отправляем первый вопрос всем участникам
-    quiz_data = json.loads(quiz.json)
-    questions = quiz_data.get("questions", [])
+    # Разбираем викторину один раз на всё время её проведения
+    compiled = quiz_cache.put(quiz)
 
-    if not questions:
+    if not compiled.question_count:
         await callback.message.answer("Викторина не содержит вопросов.")
         return
 
-    # Отправляем первый вопрос каждому участнику
-    for user_id in current_quizzes[quiz.id]["participants"]:
-        first_question = questions[0]
-        await send_question(callback.bot, user_id, first_question, 1)
+    # Отправляем первый вопрос всем участникам одновременно
+    await send_first_question(callback.bot, session, compiled, participants_count)
 
 
 # Начало создания викторины
@@ -169,8 +180,10 @@ async def stop_my_quiz(callback: CallbackQuery, callback_data: StopQuizCallbackD
     # Устанавливаем статус викторины как активный
     quiz.active = False
     await session.commit()
-    if quiz.id in current_quizzes:
-        current_quizzes.pop(quiz.id)
+    quiz_cache.invalidate(quiz.id)
+    await scoreboard.close_scoreboard(quiz.id)
+    run_state.close_quiz(quiz.id)
+    sharding.publish("quiz_stopped", quiz_id=quiz.id)
 
 
 # Начало создания викторины
@@ -187,35 +200,137 @@ async def invite_quiz(callback: CallbackQuery, callback_data: InviteQuizCallback
         await callback.message.answer(f"Это не Ваша викторина.")
         return
 
-    link = await create_start_link(callback.bot, str(quiz.id), True)
+    link = invite_links.get(quiz.id)
+    if link is None:
+        link = invite_links[quiz.id] = await create_start_link(callback.bot, str(quiz.id), True)
     await callback.message.answer(f"Ссылка для приглашения: {link}")
-    qr_code_io = generate_qr_code(link, quiz.id)
-    await callback.bot.send_photo(callback.from_user.id,
-                                  FSInputFile(f"qr_{quiz.id}.png", f"quizwings_qr_{quiz.id}.png"))
+    await send_qr_code(callback.bot, callback.from_user.id, link, f"quizwings_qr_{quiz.id}.png")
+
+
+async def send_qr_code(bot: Bot, chat_id: int, link: str, filename: str):
+    """Отправляет QR-код ссылки; после первой загрузки повторно использует file_id из Telegram"""
+    await media.send(bot, chat_id, "photo", qr_key(link), lambda: qr_code_png(link), filename)
 
 
 # Начало создания викторины
 @router.callback_query(StatsQuizCallbackData.filter())
 async def stats_quiz(callback: CallbackQuery, callback_data: StatsQuizCallbackData, state: FSMContext,
                      session: AsyncSession):
-    db_query = await session.execute(select(Stat).filter_by(quiz_id=callback_data.quiz_id).order_by(Stat.id))
-    stats = db_query.scalars().all()
+    db_query = await session.execute(select(Quiz).filter_by(id=callback_data.quiz_id, user_id=callback.from_user.id))
+    quiz = db_query.scalar()
+    if not quiz:
+        await callback.message.answer(f"Викторина с ID {callback_data.quiz_id} не найдена.")
+        return
+
+    # Отчёт выводится по страницам, сортировка по группе и имени выполняется в базе
+    page = await stats_report.fetch_page(session, quiz.id, config.stats_page_size)
+    text = stats_report.render_page(page)
+    await callback.message.answer(text, disable_web_page_preview=True,
+                                  reply_markup=generate_stats_pages(quiz.id, page))
+
+
+# Переход между страницами статистики
+@router.callback_query(StatsPageCallbackData.filter())
+async def stats_page(callback: CallbackQuery, callback_data: StatsPageCallbackData, state: FSMContext,
+                     session: AsyncSession):
+    db_query = await session.execute(select(Quiz).filter_by(id=callback_data.quiz_id, user_id=callback.from_user.id))
+    quiz = db_query.scalar()
+    if not quiz:
+        await callback.message.answer(f"Викторина с ID {callback_data.quiz_id} не найдена.")
+        return
+
+    page = await stats_report.fetch_page(session, quiz.id, config.stats_page_size,
+                                         after_id=callback_data.after, before_id=callback_data.before)
+    text = stats_report.render_page(page)
+    try:
+        await callback.message.edit_text(text, disable_web_page_preview=True,
+                                         reply_markup=generate_stats_pages(quiz.id, page))
+    except TelegramBadRequest:
+        # Страница не изменилась
+        pass
+
+
+# Статистика по вопросам: какие вопросы даются классу труднее всего
+@router.callback_query(AnalyticsQuizCallbackData.filter())
+async def analytics_quiz(callback: CallbackQuery, callback_data: AnalyticsQuizCallbackData, state: FSMContext,
+                         session: AsyncSession):
+    db_query = await session.execute(select(Quiz).filter_by(id=callback_data.quiz_id, user_id=callback.from_user.id))
+    quiz = db_query.scalar()
+    if not quiz:
+        await callback.message.answer(f"Викторина с ID {callback_data.quiz_id} не найдена.")
+        return
+
+    quiz_analytics = await analytics.get(quiz.id)
+    questions = await question_repository.get_questions(session, quiz.id)
+    for text in analytics.render(quiz_analytics, questions):
+        await callback.message.answer(text)
+
+
+# Выгрузка результатов в файл
+@router.callback_query(ExportQuizCallbackData.filter())
+async def export_quiz(callback: CallbackQuery, callback_data: ExportQuizCallbackData, state: FSMContext,
+                      session: AsyncSession):
+    db_query = await session.execute(select(Quiz).filter_by(id=callback_data.quiz_id, user_id=callback.from_user.id))
+    quiz = db_query.scalar()
+    if not quiz:
+        await callback.message.answer(f"Викторина с ID {callback_data.quiz_id} не найдена.")
+        return
 
-    # Сортировка по последнему числу в stat.name
-    stats_sorted = sorted(stats, key=lambda stat: int(stat.name.split()[-1].replace('</a>', '')))
+    if callback_data.format not in ("csv", "xlsx"):
+        await callback.message.answer("В каком формате выгрузить результаты?",
+                                      reply_markup=generate_export_formats(quiz.id))
+        return
 
-    msg = ""
-    for stat in stats_sorted:
-        msg += f"{stat.name} правильных ответов: {stat.correct_count} из {stat.total_questions}\n"
+    with_answers = await export.has_answers(session, quiz.id)
+    # Файлы пишутся на диск по мере чтения из базы и отправляются с диска
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        if callback_data.format == "xlsx":
+            path = os.path.join(directory, f"quiz_{quiz.id}.xlsx")
+            try:
+                await export.write_xlsx(session, quiz.id, path, with_answers)
+            except ImportError:
+                await callback.message.answer("Выгрузка в Excel недоступна, выберите CSV.")
+                return
+            paths.append(path)
+        else:
+            path = os.path.join(directory, f"quiz_{quiz.id}_results.csv")
+            with open(path, "wb") as file:
+                await export.write_results_csv(session, quiz.id, file)
+            paths.append(path)
+            if with_answers:
+                path = os.path.join(directory, f"quiz_{quiz.id}_answers.csv")
+                with open(path, "wb") as file:
+                    await export.write_answers_csv(session, quiz.id, file)
+                paths.append(path)
+
+        for path in paths:
+            await callback.bot.send_document(callback.from_user.id, FSInputFile(path))
+
+
+# Включение/выключение уведомлений о каждом ответе
+@router.callback_query(VerboseQuizCallbackData.filter())
+async def toggle_verbose_quiz(callback: CallbackQuery, callback_data: VerboseQuizCallbackData, state: FSMContext,
+                              session: AsyncSession):
+    db_query = await session.execute(select(Quiz).filter_by(id=callback_data.quiz_id, user_id=callback.from_user.id))
+    quiz = db_query.scalar()
+    if not quiz:
+        await callback.message.answer(f"Викторина с ID {callback_data.quiz_id} не найдена.")
+        return
 
-    await callback.message.answer(msg, disable_web_page_preview=True)
+    if quiz.id in scoreboard.verbose_quizzes:
+        scoreboard.set_verbose(quiz.id, False)
+        await callback.message.answer("Уведомления о каждом ответе выключены.")
+    else:
+        scoreboard.set_verbose(quiz.id, True)
+        await callback.message.answer("Уведомления о каждом ответе включены.")
 
 
 
 # Начало создания викторины
 @router.callback_query(F.data == "create_quiz")
 async def create_quiz(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
-    await callback.bot.send_sticker(callback.from_user.id, sticker=FSInputFile("sticker.tgs"))
+    await outbound.decoration(media.send_asset(callback.bot, callback.from_user.id, "sticker", "sticker.tgs"))
 
     await callback.message.answer("Введите название викторины:")
     await state.set_state(QuizCreation.waiting_for_quiz_name)
@@ -234,7 +349,9 @@ async def quiz_name_received(message: Message, state: FSMContext, session: Async
     temporary_quiz_data[message.from_user.id] = {
         "name": message.text
     }
-    await message.answer("Теперь давайте добавим первый вопрос. Введите текст вопроса:")
+    run_state.save_draft(message.from_user.id)
+    await message.answer("Теперь давайте добавим первый вопрос. Введите текст вопроса "
+                         "(можно отправить картинку с вопросом в подписи):")
     await state.set_state(QuizCreation.waiting_for_question_text)
 
 
@@ -243,13 +360,15 @@ async def quiz_name_received(message: Message, state: FSMContext, session: Async
 async def question_type_received(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     question_type = callback.data
     temporary_quiz_data[callback.from_user.id]['current_question_type'] = question_type
+    run_state.save_draft(callback.from_user.id)
 
     if question_type == "multiple_choice":
         await callback.message.answer("Введите варианты ответа через <b>;</b>")
         await state.set_state(QuizCreation.waiting_for_question_options)
     else:
         # Если письменный ответ, сразу переходим к правильному ответу
-        await callback.message.answer("Введите правильный ответ:")
+        await callback.message.answer("Введите правильный ответ. Несколько допустимых ответов разделяйте <b>;</b>, "
+                                      "для числа можно указать допуск: 3.14 ± 0.01")
         await state.set_state(QuizCreation.waiting_for_correct_answer)
 
 
@@ -258,6 +377,7 @@ async def question_type_received(callback: CallbackQuery, state: FSMContext, ses
 async def question_options_received(message: Message, state: FSMContext, session: AsyncSession):
     options = message.text.split(";")
     temporary_quiz_data[message.from_user.id]['current_question_options'] = [option.strip() for option in options]
+    run_state.save_draft(message.from_user.id)
 
     await message.answer("Укажите номер(а) правильных ответов через <b>;</b>")
     await state.set_state(QuizCreation.waiting_for_correct_answer)
@@ -275,18 +395,44 @@ async def correct_answer_received(message: Message, state: FSMContext, session:
                                                                                  correct_answers]
     else:
         temporary_quiz_data[message.from_user.id]['current_question_correct'] = message.text.strip()
+    run_state.save_draft(message.from_user.id)
+
+    await message.answer(f"Сколько секунд даётся на ответ? Число от {quiz_import.MIN_TIME_LIMIT} "
+                         f"до {quiz_import.MAX_TIME_LIMIT} или 0, если время не ограничено")
+    await state.set_state(QuizCreation.waiting_for_time_limit)
+
+
+# Получение ограничения времени на ответ
+@router.message(QuizCreation.waiting_for_time_limit)
+async def time_limit_received(message: Message, state: FSMContext, session: AsyncSession):
+    try:
+        time_limit = int((message.text or "").strip())
+    except ValueError:
+        time_limit = -1
+    if time_limit and not quiz_import.MIN_TIME_LIMIT <= time_limit <= quiz_import.MAX_TIME_LIMIT:
+        await message.answer(f"Введите число от {quiz_import.MIN_TIME_LIMIT} до {quiz_import.MAX_TIME_LIMIT} "
+                             f"или 0:")
+        return
+    question_type = temporary_quiz_data[message.from_user.id]['current_question_type']
 
     # Сохраняем вопрос в общий список вопросов викторины
     if "questions" not in temporary_quiz_data[message.from_user.id]:
         temporary_quiz_data[message.from_user.id]['questions'] = []
 
     # Добавляем текущий вопрос в список вопросов
-    temporary_quiz_data[message.from_user.id]['questions'].append({
+    question = {
         "type": question_type,
         "question": temporary_quiz_data[message.from_user.id]['current_question_text'],
         "options": temporary_quiz_data[message.from_user.id].get('current_question_options', []),
         "correct": temporary_quiz_data[message.from_user.id]['current_question_correct']
-    })
+    }
+    # Картинка уже загружена преподавателем, поэтому участникам отправляется по её file_id
+    if temporary_quiz_data[message.from_user.id].get('current_question_photo'):
+        question["photo"] = temporary_quiz_data[message.from_user.id]['current_question_photo']
+    if time_limit:
+        question["time_limit"] = time_limit
+    temporary_quiz_data[message.from_user.id]['questions'].append(question)
+    run_state.save_draft(message.from_user.id)
 
     builder = InlineKeyboardBuilder()
     builder.button(text="да", callback_data="add_new_question_yes")
@@ -299,18 +445,15 @@ async def correct_answer_received(message: Message, state: FSMContext, session:
 # Завершение создания викторины
 @router.callback_query(F.data == "add_new_question_no")
 async def finish_quiz_creation(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(func.max(Quiz.id)))
-    last_id = result.scalar() or 0
     quiz = Quiz(
-        id=last_id + 1,
         name=temporary_quiz_data[callback.from_user.id]['name'],
-        user_id=callback.from_user.id,
-        json=json.dumps({
-            "questions": temporary_quiz_data[callback.from_user.id]['questions']
-        })
+        user_id=callback.from_user.id
     )
-    await session.merge(quiz)
+    session.add(quiz)
+    await question_repository.add_questions(session, quiz, temporary_quiz_data[callback.from_user.id]['questions'])
     await session.commit()
+    # Сбрасываем возможную устаревшую запись кэша с тем же id
+    quiz_cache.invalidate(quiz.id)
 
     await callback.message.answer("Ваша викторина успешно создана!")
     await state.clear()
@@ -318,7 +461,7 @@ async def finish_quiz_creation(callback: CallbackQuery, state: FSMContext, sessi
     quiz = db_query.scalar()
     await callback.message.answer(f"Викторина {quiz.id}: {quiz.name}",
                                   reply_markup=generate_my_quiz(quiz))
-    temporary_quiz_data[callback.from_user.id].clear()
+    run_state.clear_draft(callback.from_user.id)
 
 
 @router.callback_query(F.data == "add_new_question_yes")
@@ -329,7 +472,15 @@ async def add_another_question(callback: CallbackQuery, state: FSMContext, sessi
 
 @router.message(QuizCreation.waiting_for_question_text)
 async def question_text_received(message: Message, state: FSMContext, session: AsyncSession):
-    temporary_quiz_data[message.from_user.id]['current_question_text'] = message.text
+    # Вопрос можно отправить картинкой с подписью
+    question_text = message.text or message.caption
+    if not question_text:
+        await message.answer("Введите текст вопроса или отправьте картинку с вопросом в подписи:")
+        return
+    temporary_quiz_data[message.from_user.id]['current_question_text'] = question_text
+    temporary_quiz_data[message.from_user.id]['current_question_photo'] = \
+        message.photo[-1].file_id if message.photo else None
+    run_state.save_draft(message.from_user.id)
 
     # Предлагаем выбрать тип вопроса: множественный выбор или письменный ответ
     builder = InlineKeyboardBuilder()
@@ -340,8 +491,78 @@ async def question_text_received(message: Message, state: FSMContext, session: A
     await state.set_state(QuizCreation.waiting_for_question_type)
 
 
-# Сохранение имен пользователей
-usernames = {}
+class QuizImport(StatesGroup):
+    waiting_for_file = State()
+
+
+IMPORT_HELP = (
+    "Отправьте файл с вопросами. Название викторины можно указать в подписи к файлу.\n\n"
+    "<b>CSV</b>: столбцы <i>вопрос, варианты через ;, номера правильных через ;</i>. "
+    "Если вариантов нет, в третьем столбце - правильный письменный ответ; допустимые ответы через ;, "
+    "у числа можно указать допуск: 3.14 ± 0.01.\n"
+    "<b>GIFT</b> (.gift, .txt): формат Moodle, вопросы с выбором, письменные, числовые и верно/неверно.\n"
+    "<b>JSON</b> (.json, .jsonl): объекты с полями type, question, options, correct "
+    "и необязательным time_limit - секунд на ответ. В .json - список таких объектов "
+    "или {\"name\": название викторины, \"questions\": [...]}."
+)
+
+
+# Импорт викторины из файла
+@router.callback_query(F.data == "import_quiz")
+async def import_quiz(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    await callback.message.answer(IMPORT_HELP)
+    await state.set_state(QuizImport.waiting_for_file)
+
+
+@router.message(Command("import_quiz"))
+async def import_quiz(message: Message, state: FSMContext, session: AsyncSession):
+    await message.delete()
+    await message.answer(IMPORT_HELP)
+    await state.set_state(QuizImport.waiting_for_file)
+
+
+@router.message(QuizImport.waiting_for_file, F.document)
+async def quiz_file_received(message: Message, state: FSMContext, session: AsyncSession):
+    file_name = message.document.file_name or ""
+    name, extension = os.path.splitext(file_name)
+    extension = extension.lower()
+    if extension not in quiz_import.PARSERS:
+        await message.answer("Поддерживаются файлы .csv, .gift, .txt, .json и .jsonl")
+        return
+
+    if message.document.file_size and message.document.file_size > config.import_max_file_size:
+        await message.answer("Файл слишком большой.")
+        return
+
+    # Файл скачивается на диск и разбирается построчно, целиком в память не загружается.
+    # Разбор идёт в пуле потоков, чтобы большой файл не останавливал обработку остальных обновлений
+    with tempfile.TemporaryFile() as file:
+        await message.bot.download(message.document, destination=file)
+        file_quiz_name, questions, errors = await asyncio.get_running_loop().run_in_executor(
+            None, quiz_import.read_questions, file, extension, config.import_max_questions)
+
+    if errors:
+        await message.answer("Викторина не создана, исправьте ошибки и отправьте файл ещё раз:\n" +
+                             html.escape("\n".join(errors)))
+        return
+
+    if not questions:
+        await message.answer("В файле нет вопросов.")
+        return
+
+    quiz = Quiz(
+        name=message.caption or file_quiz_name or name,
+        user_id=message.from_user.id
+    )
+    session.add(quiz)
+    await question_repository.add_questions(session, quiz, questions)
+    await session.commit()
+    quiz_cache.invalidate(quiz.id)
+    await state.clear()
+
+    await message.answer(f"Викторина создана, вопросов: {len(questions)}")
+    await message.answer(f"Викторина {quiz.id}: {html.escape(quiz.name)}",
+                         reply_markup=generate_my_quiz(quiz))
 
 
 # Начало участия в викторине
@@ -384,7 +605,7 @@ async def name_received(message: Message, state: FSMContext, session: AsyncSessi
     quiz_id = data.get("quiz_id")
 
     # Сохраняем имя в словаре usernames
-    usernames[message.from_user.id] = message.text
+    run_state.set_username(message.from_user.id, message.text)
 
     quiz = await session.get(Quiz, quiz_id)
     if not quiz:
@@ -397,13 +618,7 @@ async def name_received(message: Message, state: FSMContext, session: AsyncSessi
         return
 
     # Добавляем студента в список участников викторины
-    if quiz_id not in current_quizzes:
-        current_quizzes[quiz_id] = {"participants": {}}
-
-    current_quizzes[quiz_id]["participants"][message.from_user.id] = {
-        "current_question": 0,
-        "correct_answers": 0
-    }
+    run_state.add_participant(quiz_id, message.from_user.id)
 
     await message.answer(f"{message.text}, вы добавлены к викторине. Ожидание начала викторины от преподавателя.")
     await state.set_state(QuizParticipation.waiting_for_answer)
@@ -433,22 +648,20 @@ async def start_quiz(message: Message, session: AsyncSession):
     await session.commit()
 
     # Проверяем, есть ли участники
-    if quiz_id not in current_quizzes or not current_quizzes[quiz_id]["participants"]:
+    participants_count = await run_state.count_participants(quiz_id)
+    if not participants_count:
         await message.answer("Нет участников для начала викторины.")
         return
 
-    # Отправляем первый вопрос всем участникам
-    quiz_data = json.loads(quiz.json)
-    questions = quiz_data.get("questions", [])
+    # Разбираем викторину один раз на всё время её проведения
+    compiled = quiz_cache.put(quiz)
 
-    if not questions:
+    if not compiled.question_count:
         await message.answer("Викторина не содержит вопросов.")
         return
 
-    # Отправляем первый вопрос каждому участнику
-    for user_id in current_quizzes[quiz_id]["participants"]:
-        first_question = questions[0]
-        await send_question(message.bot, user_id, first_question, 1)
+    # Отправляем первый вопрос всем участникам одновременно
+    await send_first_question(message.bot, session, compiled, participants_count)
 
 
 @router.message(F.text.startswith("/quiz_stop "))
@@ -471,175 +684,407 @@ async def stop_quiz(message: Message, session: AsyncSession):
     # Устанавливаем статус викторины как активный
     quiz.active = False
     await session.commit()
-    if quiz.id in current_quizzes:
-        current_quizzes.pop(quiz.id)
+    quiz_cache.invalidate(quiz.id)
+    await scoreboard.close_scoreboard(quiz.id)
+    run_state.close_quiz(quiz.id)
+    sharding.publish("quiz_stopped", quiz_id=quiz.id)
 
 
-async def send_question(bot: Bot, user_id: int, question_data: dict, question_number: int):
+async def send_question(bot: Bot, user_id: int, question_data: dict, question_number: int, quiz_id: int = None):
     """Отправляет вопрос, в зависимости от его типа"""
     question_type = question_data["type"]
+    # Картинка вопроса отправляется по file_id, без повторной загрузки
+    photo = question_data.get("photo")
+    time_limit = question_data.get("time_limit")
 
     if question_type == "multiple_choice":
+        if photo:
+            await bot.send_photo(user_id, photo)
         # Отправляем опрос
         options = question_data["options"]
-        await bot.send_poll(
+        poll_message = await bot.send_poll(
             chat_id=user_id,
             allows_multiple_answers=True,
             question=question_data['question'],
             options=options,
             is_anonymous=False,
             type="regular",  # Устанавливаем тип опроса "викторина" для одного правильного ответа
+            # Telegram сам закроет опрос, когда время выйдет
+            open_period=time_limit
         )
+        # Запоминаем опрос, чтобы найти викторину и вопрос по poll_id
+        if quiz_id is not None:
+            run_state.register_poll(poll_message.poll.id, quiz_id, user_id, question_number - 1)
     elif question_type == "written":
         # Отправляем текстовый вопрос
-        await bot.send_message(user_id, f"Вопрос {question_number}: {question_data['question']}")
+        text = f"Вопрос {question_number}: {question_data['question']}"
+        if time_limit:
+            text += f"\n\n⏱ На ответ {time_limit} с"
+        if photo:
+            await bot.send_photo(user_id, photo, caption=text)
+        else:
+            await bot.send_message(user_id, text)
+    # Отсюда считается время ответа
+    if quiz_id is not None:
+        run_state.mark_question_sent(user_id)
+        if time_limit:
+            # Для опроса - с запасом, чтобы успел дойти ответ, отправленный в последний момент
+            if question_type == "multiple_choice":
+                time_limit += config.poll_deadline_grace
+            run_state.set_deadline(quiz_id, user_id, time_limit)
+
+
+def _local_participants(quiz_id: int) -> list:
+    return list(current_quizzes.get(quiz_id, {}).get("participants", ()))
+
+
+async def send_first_question(bot: Bot, session: AsyncSession, compiled: quiz_cache.CompiledQuiz,
+                              participants_count: int):
+    """Рассылает первый вопрос всем участникам и показывает преподавателю ход рассылки"""
+    quiz_id = compiled.quiz_id
+    first_question = await compiled.question(session, 0)
+    participants = _local_participants(quiz_id)
+
+    # Ответы в журнале относятся к этому проведению викторины
+    run = QuizRun(quiz_id=quiz_id)
+    session.add(run)
+    await session.commit()
+    run_state.start_run(quiz_id, run.id)
+
+    # Сводка по викторине вместо отдельного сообщения на каждый ответ
+    await scoreboard.open_scoreboard(bot, quiz_id, compiled.name, compiled.owner_id, len(compiled),
+                                     participants_count)
+    # Участникам, которых обслуживают другие процессы, первый вопрос отправят эти процессы
+    sharding.publish("quiz_started", quiz_id=quiz_id, run_id=run.id)
+
+    with outbound.priority(outbound.TEACHER):
+        status = await bot.send_message(compiled.owner_id, f"Отправка первого вопроса: 0 из {len(participants)}")
+    last_update = time.monotonic()
+
+    async def on_progress(result):
+        nonlocal last_update
+        if result.total == len(participants) or time.monotonic() - last_update < config.broadcast_progress_interval:
+            return
+        last_update = time.monotonic()
+        try:
+            with outbound.priority(outbound.TEACHER):
+                await status.edit_text(f"Отправка первого вопроса: {result.total} из {len(participants)}")
+        except TelegramBadRequest:
+            pass
+
+    result = await broadcaster.broadcast(
+        participants,
+        lambda user_id: send_question(bot, user_id, first_question.data, 1, quiz_id),
+        on_progress
+    )
+
+    text = f"Первый вопрос отправлен {len(result.sent)} из {len(participants)} участникам."
+    if result.failed:
+        failed_names = [html.escape(usernames.get(user_id, str(user_id))) for user_id in result.failed]
+        text += f"\nНе удалось отправить: {', '.join(failed_names)}"
+    with outbound.priority(outbound.TEACHER):
+        await status.edit_text(text)
+
+
+@sharding.on_event("quiz_started")
+async def on_quiz_started(bot: Bot, session_pool, quiz_id: int, run_id: int, **kwargs):
+    """Рассылает первый вопрос участникам этого процесса; преподавателю сообщаем только о неудачах"""
+    participants = _local_participants(quiz_id)
+    if not participants:
+        return
+    run_state.start_run(quiz_id, run_id)
+    async with session_pool() as session:
+        compiled = await quiz_cache.load(session, quiz_id)
+        first_question = None if compiled is None else await compiled.question(session, 0)
+    if first_question is None:
+        return
+
+    result = await broadcaster.broadcast(
+        participants,
+        lambda user_id: send_question(bot, user_id, first_question.data, 1, quiz_id)
+    )
+    if result.failed:
+        failed_names = [html.escape(usernames.get(user_id, str(user_id))) for user_id in result.failed]
+        outbound.notify(bot, compiled.owner_id, f"Не удалось отправить первый вопрос: {', '.join(failed_names)}")
+
+
+@sharding.on_event("quiz_stopped")
+async def on_quiz_stopped(quiz_id: int, **kwargs):
+    quiz_cache.invalidate(quiz_id)
+    run_state.close_quiz(quiz_id)
 
 
 # Обработка ответа пользователя
 @router.poll_answer()
-async def handle_poll_answer(poll_answer: PollAnswer, session: AsyncSession, state: FSMContext):
-    user_id = poll_answer.user.id
+async def handle_poll_answer(poll_answer: PollAnswer, session: AsyncSession, state: FSMContext,
+                             stat_writer: BatchWriter, answer_writer: BatchWriter):
+    # Находим викторину и вопрос по опросу
+    route = routing.get_poll_route(poll_answer.poll_id)
+    if route is None:
+        return
+    quiz_id, user_id, question_index = route
 
-    # Находим викторину, в которой участвует студент
-    for quiz_id, quiz_data in current_quizzes.items():
-        if user_id in quiz_data["participants"]:
-            break
-    else:
+    quiz_data = current_quizzes.get(quiz_id)
+    if quiz_data is None or user_id not in quiz_data["participants"]:
         return
 
-    q = await session.get(Quiz, quiz_id)
+    # Повторный или запоздалый ответ на уже пройденный вопрос
+    if quiz_data["participants"][user_id]["current_question"] != question_index:
+        return
+    run_state.forget_poll(poll_answer.poll_id)
+    run_state.clear_deadline(quiz_id, user_id)
 
-    questions = json.loads(q.json)["questions"]
+    compiled = await quiz_cache.load(session, quiz_id)
     current_question_index = quiz_data["participants"][user_id]["current_question"]
-    current_question = questions[current_question_index]
+    current_question = await compiled.question(session, current_question_index)
 
     # Проверка ответа
-    correct_option_ids = current_question["correct"]
-    if set(poll_answer.option_ids) == set(correct_option_ids):
+    is_correct = set(poll_answer.option_ids) == current_question.correct_options
+    if is_correct:
         quiz_data["participants"][user_id]["correct_answers"] += 1
+    latency_ms = run_state.answer_latency_ms(user_id)
+    scoreboard.record_answer(compiled.owner_id, quiz_id, current_question_index, is_correct)
+    await analytics.record_answer(compiled.owner_id, quiz_id, current_question_index, is_correct,
+                                  poll_answer.option_ids, latency_ms)
+    answer_writer.put(
+        run_id=quiz_data.get("run_id"),
+        quiz_id=quiz_id,
+        user_id=user_id,
+        question_index=current_question_index,
+        options=json.dumps(poll_answer.option_ids),
+        text=None,
+        is_correct=is_correct,
+        latency_ms=latency_ms
+    )
 
-        quiz = await session.get(Quiz, quiz_id)
-        await poll_answer.bot.send_message(
-            quiz.user_id,
-            f"{get_clickable_name(poll_answer.user)} ответил правильно на вопрос {current_quizzes[quiz_id]['participants'][user_id]['current_question'] + 1}",
-            disable_web_page_preview=True
-        )
-    else:
-        quiz = await session.get(Quiz, quiz_id)
-        await poll_answer.bot.send_message(
-            quiz.user_id,
-            f"{get_clickable_name(poll_answer.user)} ответил неправильно на вопрос {current_quizzes[quiz_id]['participants'][user_id]['current_question'] + 1}: {'; '.join([current_question['options'][i] for i in poll_answer.option_ids])}",
-            disable_web_page_preview=True
-        )
+    # Уведомления о каждом ответе - только если преподаватель их включил
+    if quiz_id in scoreboard.verbose_quizzes:
+        if is_correct:
+            outbound.notify(
+                poll_answer.bot,
+                compiled.owner_id,
+                f"{get_clickable_name(poll_answer.user)} ответил правильно на вопрос {current_quizzes[quiz_id]['participants'][user_id]['current_question'] + 1}"
+            )
+        else:
+            outbound.notify(
+                poll_answer.bot,
+                compiled.owner_id,
+                f"{get_clickable_name(poll_answer.user)} ответил неправильно на вопрос {current_quizzes[quiz_id]['participants'][user_id]['current_question'] + 1}: {'; '.join([current_question.data['options'][i] for i in poll_answer.option_ids])}"
+            )
 
     # Переход к следующему вопросу
     current_quizzes[quiz_id]["participants"][user_id]["current_question"] += 1
     next_question_index = current_quizzes[quiz_id]["participants"][user_id]["current_question"]
+    run_state.save_participant(quiz_id, user_id)
 
-    if next_question_index < len(questions):
-        next_question = questions[next_question_index]
-        await send_question(poll_answer.bot, user_id, next_question, next_question_index + 1)
+    if next_question_index < len(compiled):
+        next_question = await compiled.question(session, next_question_index)
+        await send_question(poll_answer.bot, user_id, next_question.data, next_question_index + 1, quiz_id)
     else:
         # Викторина завершена для пользователя
         correct_count = quiz_data["participants"][user_id]["correct_answers"]
-        total_questions = len(questions)
+        total_questions = len(compiled)
         await poll_answer.bot.send_message(user_id,
                                            f"Викторина завершена! Вы ответили правильно на {correct_count} из {total_questions} вопросов.")
-        quiz = await session.get(Quiz, quiz_id)
-        await poll_answer.bot.send_message(
-            quiz.user_id,
-            f"{get_clickable_name(poll_answer.user)} закончил викторину. Правильных ответов: {correct_count} из {total_questions}.",
-            disable_web_page_preview=True
-        )
+        scoreboard.record_finish(compiled.owner_id, quiz_id)
+        if quiz_id in scoreboard.verbose_quizzes:
+            outbound.notify(
+                poll_answer.bot,
+                compiled.owner_id,
+                f"{get_clickable_name(poll_answer.user)} закончил викторину. Правильных ответов: {correct_count} из {total_questions}."
+            )
         await state.clear()
 
-        result = await session.execute(select(func.max(Stat.id)))
-        last_id = result.scalar() or 0
-        stat = Stat(
-            id=last_id + 1,
+        # Результат пишется в базу в фоне, пачкой вместе с результатами других студентов
+        display_name, group_number = stats_report.parse_participant_name(
+            usernames.get(user_id) or poll_answer.user.full_name
+        )
+        stat_writer.put(
             user_id=poll_answer.user.id,
             name=get_clickable_name(poll_answer.user),
             quiz_id=quiz_id,
             correct_count=correct_count,
-            total_questions=total_questions
+            total_questions=total_questions,
+            display_name=display_name,
+            group_number=group_number
         )
-        await session.merge(stat)
-        await session.commit()
-        quiz_data["participants"].pop(user_id)
+        run_state.remove_participant(quiz_id, user_id)
         # Можно добавить логику удаления пользователя из списка участников после завершения
 
 
 # Обработка письменных ответов
 @router.message(QuizParticipation.waiting_for_answer)
-async def handle_written_answer(message: Message, session: AsyncSession, state: FSMContext):
+async def handle_written_answer(message: Message, session: AsyncSession, state: FSMContext,
+                                stat_writer: BatchWriter, answer_writer: BatchWriter):
     user_id = message.from_user.id
 
     # Находим викторину, в которой участвует студент
-    for quiz_id, quiz_data in current_quizzes.items():
-        if user_id in quiz_data["participants"]:
-            break
-    else:
+    quiz_id = routing.get_participant_quiz(user_id)
+    quiz_data = current_quizzes.get(quiz_id)
+    if quiz_data is None or user_id not in quiz_data["participants"]:
         await message.answer("У вас нет активной викторины.")
         await state.clear()
         return
 
-    questions = json.loads((await session.get(Quiz, quiz_id)).json)["questions"]
+    run_state.clear_deadline(quiz_id, user_id)
+    compiled = await quiz_cache.load(session, quiz_id)
     current_question_index = quiz_data["participants"][user_id]["current_question"]
-    current_question = questions[current_question_index]
+    current_question = await compiled.question(session, current_question_index)
 
     # Проверка правильности ответа
-    correct_answer = current_question["correct"].strip().lower()
-    user_answer = message.text.strip().lower()
+    is_correct = current_question.is_correct_text(message.text)
+    latency_ms = run_state.answer_latency_ms(user_id)
+    scoreboard.record_answer(compiled.owner_id, quiz_id, current_question_index, is_correct)
+    await analytics.record_answer(compiled.owner_id, quiz_id, current_question_index, is_correct,
+                                  latency_ms=latency_ms)
+    answer_writer.put(
+        run_id=quiz_data.get("run_id"),
+        quiz_id=quiz_id,
+        user_id=user_id,
+        question_index=current_question_index,
+        options=None,
+        text=message.text,
+        is_correct=is_correct,
+        latency_ms=latency_ms
+    )
+    verbose = quiz_id in scoreboard.verbose_quizzes
 
-    if user_answer == correct_answer:
+    if is_correct:
         quiz_data["participants"][user_id]["correct_answers"] += 1
         await message.answer("Правильно!")
-        quiz = await session.get(Quiz, quiz_id)
-        await message.bot.send_message(
-            quiz.user_id,
-            f"{get_clickable_name(message.from_user)} ответил правильно на вопрос {current_quizzes[quiz_id]['participants'][user_id]['current_question'] + 1}",
-            disable_web_page_preview=True
-        )
+        if verbose:
+            outbound.notify(
+                message.bot,
+                compiled.owner_id,
+                f"{get_clickable_name(message.from_user)} ответил правильно на вопрос {current_quizzes[quiz_id]['participants'][user_id]['current_question'] + 1}"
+            )
     else:
-        await message.answer(f"Неправильно. Правильный ответ: {current_question['correct']}")
-        quiz = await session.get(Quiz, quiz_id)
-        await message.bot.send_message(
-            quiz.user_id,
-            f"{get_clickable_name(message.from_user)} ответил неправильно на вопрос {current_quizzes[quiz_id]['participants'][user_id]['current_question'] + 1}: {message.text}",
-            disable_web_page_preview=True
-        )
+        await message.answer(f"Неправильно. Правильный ответ: {current_question.data['correct']}")
+        if verbose:
+            outbound.notify(
+                message.bot,
+                compiled.owner_id,
+                f"{get_clickable_name(message.from_user)} ответил неправильно на вопрос {current_quizzes[quiz_id]['participants'][user_id]['current_question'] + 1}: {message.text}"
+            )
 
     # Переход к следующему вопросу
     current_quizzes[quiz_id]["participants"][user_id]["current_question"] += 1
     next_question_index = current_quizzes[quiz_id]["participants"][user_id]["current_question"]
+    run_state.save_participant(quiz_id, user_id)
 
-    if next_question_index < len(questions):
-        next_question = questions[next_question_index]
-        await send_question(message.bot, user_id, next_question, next_question_index + 1)
+    if next_question_index < len(compiled):
+        next_question = await compiled.question(session, next_question_index)
+        await send_question(message.bot, user_id, next_question.data, next_question_index + 1, quiz_id)
     else:
         # Викторина завершена для пользователя
         correct_count = quiz_data["participants"][user_id]["correct_answers"]
-        total_questions = len(questions)
+        total_questions = len(compiled)
         await message.answer(
             f"Викторина завершена! Вы ответили правильно на {correct_count} из {total_questions} вопросов.")
         await state.clear()
-        quiz = await session.get(Quiz, quiz_id)
-        await message.bot.send_message(
-            quiz.user_id,
-            f"{get_clickable_name(message.from_user)} закончил викторину. Правильных ответов: {correct_count} из {total_questions}.",
-            disable_web_page_preview=True
+        scoreboard.record_finish(compiled.owner_id, quiz_id)
+        if verbose:
+            outbound.notify(
+                message.bot,
+                compiled.owner_id,
+                f"{get_clickable_name(message.from_user)} закончил викторину. Правильных ответов: {correct_count} из {total_questions}."
+            )
+
+        # Результат пишется в базу в фоне, пачкой вместе с результатами других студентов
+        display_name, group_number = stats_report.parse_participant_name(
+            usernames.get(user_id) or message.from_user.full_name
         )
-
-        result = await session.execute(select(func.max(Stat.id)))
-        last_id = result.scalar() or 0
-        stat = Stat(
-            id=last_id + 1,
+        stat_writer.put(
             user_id=message.from_user.id,
             name=get_clickable_name(message.from_user),
             quiz_id=quiz_id,
             correct_count=correct_count,
-            total_questions=total_questions
+            total_questions=total_questions,
+            display_name=display_name,
+            group_number=group_number
         )
-        await session.merge(stat)
-        await session.commit()
-        quiz_data["participants"].pop(user_id)
+        run_state.remove_participant(quiz_id, user_id)
+
+
+async def start_deadlines(bot: Bot, dispatcher: Dispatcher, session_pool, stat_writer: BatchWriter,
+                          answer_writer: BatchWriter):
+    """Запускает таймер сроков ответа; вызывается при запуске диспетчера"""
+    deadlines.start(partial(expire_questions, bot, dispatcher.fsm, session_pool, stat_writer, answer_writer))
+
+
+# Время на ответ вышло
+async def expire_questions(bot: Bot, fsm, session_pool, stat_writer: BatchWriter, answer_writer: BatchWriter,
+                           expired: list):
+    """Засчитывает вопросы с истёкшим сроком как оставшиеся без ответа и отправляет участникам следующие"""
+    # user_id -> (данные следующего вопроса, его номер) или текст об окончании викторины
+    next_steps = {}
+    async with session_pool() as session:
+        for user_id, quiz_id, question_index in expired:
+            quiz_data = current_quizzes.get(quiz_id)
+            participant = None if quiz_data is None else quiz_data["participants"].get(user_id)
+            # Участник успел ответить или уже вышел из викторины
+            if participant is None or participant["current_question"] != question_index:
+                continue
+            compiled = await quiz_cache.load(session, quiz_id)
+            if compiled is None:
+                continue
+
+            participant.pop("deadline", None)
+            # Опрос уже закрыт, ответа на него не будет
+            for poll_id in list(routing.user_polls.get(user_id, ())):
+                run_state.forget_poll(poll_id)
+            run_state.answer_latency_ms(user_id)
+            scoreboard.record_answer(compiled.owner_id, quiz_id, question_index, False)
+            await analytics.record_answer(compiled.owner_id, quiz_id, question_index, False)
+            answer_writer.put(
+                run_id=quiz_data.get("run_id"),
+                quiz_id=quiz_id,
+                user_id=user_id,
+                question_index=question_index,
+                options=None,
+                text=None,
+                is_correct=False,
+                latency_ms=None
+            )
+
+            # Переход к следующему вопросу
+            participant["current_question"] += 1
+            next_question_index = participant["current_question"]
+            run_state.save_participant(quiz_id, user_id)
+
+            if next_question_index < len(compiled):
+                next_question = await compiled.question(session, next_question_index)
+                next_steps[user_id] = (next_question.data, next_question_index + 1, quiz_id)
+                continue
+
+            # Викторина завершена для пользователя
+            correct_count = participant["correct_answers"]
+            total_questions = len(compiled)
+            next_steps[user_id] = f"Викторина завершена! Вы ответили правильно на {correct_count} из " \
+                                  f"{total_questions} вопросов."
+            scoreboard.record_finish(compiled.owner_id, quiz_id)
+            await fsm.get_context(bot, user_id, user_id).clear()
+
+            name = usernames.get(user_id) or str(user_id)
+            display_name, group_number = stats_report.parse_participant_name(name)
+            stat_writer.put(
+                user_id=user_id,
+                name=html.escape(name),
+                quiz_id=quiz_id,
+                correct_count=correct_count,
+                total_questions=total_questions,
+                display_name=display_name,
+                group_number=group_number
+            )
+            run_state.remove_participant(quiz_id, user_id)
+
+    async def send(user_id):
+        step = next_steps[user_id]
+        await bot.send_message(user_id, "⏱ Время на ответ вышло, вопрос остался без ответа.")
+        if isinstance(step, str):
+            await bot.send_message(user_id, step)
+        else:
+            await send_question(bot, user_id, *step)
+
+    # Сроки многих участников истекают одновременно, поэтому отправляем с соблюдением лимитов
+    await broadcaster.broadcast(next_steps, send)
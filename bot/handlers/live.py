@@ -0,0 +1,241 @@
+import html
+import json
+
+from aiogram import Router, F, Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, PollAnswer, Poll
+from aiogram.utils.callback_answer import CallbackAnswer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot import sharding
+from bot.common import LiveQuizCallbackData
+from bot.db import Quiz, QuizRun
+from bot.db.writer import BatchWriter
+from bot.keyboards import generate_live_controls
+from bot.utils import live, quiz_cache, analytics
+
+router = Router(name="live-router")
+
+GROUP_CHATS = {"group", "supergroup"}
+# Сколько участников показывать в итогах викторины в чате
+LEADERBOARD_SIZE = 10
+
+# Чаты, где преподаватель прямо сейчас переключает вопрос: повторное нажатие кнопки игнорируется
+_advancing = set()
+
+
+def _is_live_poll(poll_answer: PollAnswer) -> bool:
+    return poll_answer.poll_id in live.questions
+
+
+def _is_live_reply(message: Message) -> bool:
+    return message.reply_to_message is not None and \
+        live.question_key(message.chat.id, message.reply_to_message.message_id) in live.questions
+
+
+# Запуск викторины в групповом чате: /quiz_live <id>
+@router.message(Command("quiz_live"), F.chat.type.in_(GROUP_CHATS))
+async def start_live_quiz(message: Message, command: CommandObject, session: AsyncSession):
+    try:
+        quiz_id = int(command.args.split()[0])
+    except (AttributeError, IndexError, ValueError):
+        await message.answer("Неверный формат команды. Используйте /quiz_live <id_викторины>.")
+        return
+
+    quiz = await session.get(Quiz, quiz_id)
+    if not quiz:
+        await message.answer(f"Викторина с ID {quiz_id} не найдена.")
+        return
+    if quiz.user_id != message.from_user.id:
+        await message.answer("Это не Ваша викторина.")
+        return
+    if message.chat.id in live.chats:
+        await message.answer("В этом чате уже идёт викторина.")
+        return
+
+    compiled = quiz_cache.put(quiz)
+    if not compiled.question_count:
+        await message.answer("Викторина не содержит вопросов.")
+        return
+
+    run = QuizRun(quiz_id=quiz.id)
+    session.add(run)
+    await session.commit()
+    live.start(message.chat.id, quiz.id, quiz.user_id, run.id)
+
+    await message.answer(f"Викторина <b>{html.escape(quiz.name or '')}</b>: {len(compiled)} вопросов.\n"
+                         f"Голосуйте в опросах, а на вопросы с письменным ответом отвечайте ответом на сообщение "
+                         f"с вопросом. Следующий вопрос открывает преподаватель.")
+    await post_question(message.bot, session, message.chat.id, compiled, 0)
+
+
+async def post_question(bot: Bot, session: AsyncSession, chat_id: int, compiled: quiz_cache.CompiledQuiz,
+                        index: int):
+    """Публикует вопрос в чате одним сообщением для всех участников"""
+    question = (await compiled.question(session, index)).data
+    controls = generate_live_controls(last=index + 1 == len(compiled))
+    header = f"Вопрос {index + 1} из {len(compiled)}"
+    if question.get("photo"):
+        await bot.send_photo(chat_id, question["photo"], caption=header)
+
+    if question["type"] == "multiple_choice":
+        message = await bot.send_poll(
+            chat_id=chat_id,
+            question=question["question"],
+            options=question["options"],
+            is_anonymous=False,
+            allows_multiple_answers=True,
+            type="regular",
+            open_period=question.get("time_limit"),
+            reply_markup=controls
+        )
+        key = message.poll.id
+    else:
+        message = await bot.send_message(chat_id, f"{header}: {html.escape(question['question'])}\n\n"
+                                                  f"Ответьте на это сообщение.", reply_markup=controls)
+        key = live.question_key(chat_id, message.message_id)
+    live.question_posted(chat_id, index, key, message.message_id)
+
+
+async def grade_question(bot: Bot, session: AsyncSession, chat_id: int, answer_writer: BatchWriter,
+                         close_poll: bool = True):
+    """Проверяет разом все ответы на текущий вопрос и публикует, сколько участников ответили правильно"""
+    state = live.chats.get(chat_id)
+    if state is None or state["graded"]:
+        return
+    chat_answers = live.take_answers(chat_id)
+    compiled = await quiz_cache.load(session, state["quiz_id"])
+    question_index = state["question"]
+    question = await compiled.question(session, question_index)
+
+    correct_count = 0
+    for user_key, answer in chat_answers.items():
+        if answer["options"] is not None:
+            is_correct = set(answer["options"]) == question.correct_options
+        else:
+            is_correct = question.is_correct_text(answer["text"])
+        correct_count += is_correct
+        state["scores"][user_key] = state["scores"].get(user_key, 0) + is_correct
+        await analytics.record_answer(state["owner_id"], state["quiz_id"], question_index, is_correct,
+                                      answer["options"], answer["latency_ms"])
+        answer_writer.put(
+            run_id=state["run_id"],
+            quiz_id=state["quiz_id"],
+            user_id=int(user_key),
+            question_index=question_index,
+            options=None if answer["options"] is None else json.dumps(answer["options"]),
+            text=answer["text"],
+            is_correct=is_correct,
+            latency_ms=answer["latency_ms"]
+        )
+    live.save(chat_id)
+
+    # Убираем кнопки со старого вопроса; опрос при этом закрывается, если Telegram ещё не закрыл его сам
+    try:
+        if question.data["type"] == "multiple_choice":
+            if close_poll:
+                await bot.stop_poll(chat_id, state["message_id"])
+        else:
+            await bot.edit_message_reply_markup(chat_id=chat_id, message_id=state["message_id"])
+    except TelegramBadRequest:
+        pass
+
+    text = f"Вопрос {question_index + 1}: правильно ответили {correct_count} из {len(chat_answers)}."
+    if question.data["type"] == "written":
+        text += f"\nПравильный ответ: {html.escape(question.data['correct'])}"
+    await bot.send_message(chat_id, text)
+
+
+async def finish_live_quiz(bot: Bot, chat_id: int, stat_writer: BatchWriter, total_questions: int):
+    """Публикует итоги в чате и сохраняет результаты участников"""
+    state = live.finish(chat_id)
+    ranking = sorted(state["scores"].items(), key=lambda item: -item[1])
+
+    lines = [f"Викторина завершена! Участников: {len(ranking)}."]
+    for place, (user_key, correct_count) in enumerate(ranking[:LEADERBOARD_SIZE], 1):
+        name = html.escape(state["names"].get(user_key, user_key))
+        lines.append(f"{place}. {name}: {correct_count} из {total_questions}")
+    await bot.send_message(chat_id, "\n".join(lines))
+
+    # В чате имена берутся из Telegram, номера группы в них нет
+    for user_key, correct_count in ranking:
+        name = state["names"].get(user_key, user_key)
+        stat_writer.put(
+            user_id=int(user_key),
+            name=html.escape(name),
+            quiz_id=state["quiz_id"],
+            correct_count=correct_count,
+            total_questions=total_questions,
+            display_name=name,
+            group_number=0
+        )
+
+
+# Кнопки преподавателя под вопросом
+@router.callback_query(LiveQuizCallbackData.filter())
+async def live_quiz_control(callback: CallbackQuery, callback_data: LiveQuizCallbackData, session: AsyncSession,
+                            callback_answer: CallbackAnswer, stat_writer: BatchWriter,
+                            answer_writer: BatchWriter):
+    chat_id = callback.message.chat.id
+    state = live.chats.get(chat_id)
+    if state is None or callback.message.message_id != state["message_id"]:
+        callback_answer.text = "Этот вопрос уже закрыт."
+        return
+    if callback.from_user.id != state["owner_id"]:
+        callback_answer.text = "Вопросы переключает преподаватель."
+        callback_answer.show_alert = True
+        return
+
+    if chat_id in _advancing:
+        return
+
+    _advancing.add(chat_id)
+    try:
+        await grade_question(callback.bot, session, chat_id, answer_writer)
+        compiled = await quiz_cache.load(session, state["quiz_id"])
+        next_index = state["question"] + 1
+        if callback_data.action == "next" and next_index < len(compiled):
+            await post_question(callback.bot, session, chat_id, compiled, next_index)
+        else:
+            # Как и в личных сообщениях, результат - из всех вопросов викторины, даже если её остановили раньше
+            await finish_live_quiz(callback.bot, chat_id, stat_writer, compiled.question_count)
+    finally:
+        _advancing.discard(chat_id)
+
+
+@router.poll_answer(_is_live_poll)
+async def live_poll_answer(poll_answer: PollAnswer):
+    live.record_answer(poll_answer.poll_id, poll_answer.user.id, poll_answer.user.full_name,
+                       options=poll_answer.option_ids)
+
+
+@router.message(F.chat.type.in_(GROUP_CHATS), F.text, _is_live_reply)
+async def live_written_answer(message: Message):
+    live.record_answer(live.question_key(message.chat.id, message.reply_to_message.message_id),
+                       message.from_user.id, message.from_user.full_name, text=message.text)
+
+
+# Опрос закрылся сам, когда вышло время
+@router.poll(F.is_closed)
+async def live_poll_closed(poll: Poll, bot: Bot, session: AsyncSession, answer_writer: BatchWriter):
+    route = live.questions.get(poll.id)
+    if route is None:
+        return
+    chat_id, owner_id = route
+    if not sharding.is_local(owner_id):
+        sharding.publish("live_poll_closed", shard=sharding.shard_for(owner_id), chat_id=chat_id, key=poll.id)
+        return
+    state = live.chats.get(chat_id)
+    if state is not None and state["key"] == poll.id:
+        await grade_question(bot, session, chat_id, answer_writer, close_poll=False)
+
+
+@sharding.on_event("live_poll_closed")
+async def on_live_poll_closed(bot: Bot, session_pool, answer_writer: BatchWriter, chat_id: int, key: str,
+                              **kwargs):
+    state = live.chats.get(chat_id)
+    if state is None or state["key"] != key:
+        return
+    async with session_pool() as session:
+        await grade_question(bot, session, chat_id, answer_writer, close_poll=False)
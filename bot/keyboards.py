@@ -2,13 +2,15 @@ from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from bot.common import SelectQuizCallbackData, InviteQuizCallbackData, StopQuizCallbackData, \
-    StartQuizCallbackData, StatsQuizCallbackData
+    StartQuizCallbackData, StatsQuizCallbackData, VerboseQuizCallbackData, StatsPageCallbackData, \
+    AnalyticsQuizCallbackData, ExportQuizCallbackData, LiveQuizCallbackData
 
 
 def generate_main_menu() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="новая викторина", callback_data="create_quiz")
     builder.button(text="мои викторины", callback_data="my_quizzes")
+    builder.button(text="импорт из файла", callback_data="import_quiz")
     return builder.adjust(2).as_markup()
 
 
@@ -26,5 +28,35 @@ def generate_my_quiz(quiz) -> InlineKeyboardMarkup:
     builder.button(text=f"стоп", callback_data=StopQuizCallbackData(quiz_id=quiz.id))
     builder.button(text=f"QR-code", callback_data=InviteQuizCallbackData(quiz_id=quiz.id))
     builder.button(text=f"статистика", callback_data=StatsQuizCallbackData(quiz_id=quiz.id))
+    builder.button(text=f"аналитика по вопросам", callback_data=AnalyticsQuizCallbackData(quiz_id=quiz.id))
+    builder.button(text=f"экспорт", callback_data=ExportQuizCallbackData(quiz_id=quiz.id))
+    builder.button(text=f"уведомления об ответах", callback_data=VerboseQuizCallbackData(quiz_id=quiz.id))
+
+    return builder.adjust(2).as_markup()
+
+
+def generate_stats_pages(quiz_id: int, page):
+    builder = InlineKeyboardBuilder()
+    if page.has_prev:
+        builder.button(text="« назад", callback_data=StatsPageCallbackData(quiz_id=quiz_id, before=page.first_id))
+    if page.has_next:
+        builder.button(text="дальше »", callback_data=StatsPageCallbackData(quiz_id=quiz_id, after=page.last_id))
+
+    return builder.adjust(2).as_markup()
+
+
+def generate_export_formats(quiz_id: int) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.button(text="CSV", callback_data=ExportQuizCallbackData(quiz_id=quiz_id, format="csv"))
+    builder.button(text="Excel (XLSX)", callback_data=ExportQuizCallbackData(quiz_id=quiz_id, format="xlsx"))
+
+    return builder.adjust(2).as_markup()
+
+
+def generate_live_controls(last: bool) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    if not last:
+        builder.button(text="следующий вопрос »", callback_data=LiveQuizCallbackData(action="next"))
+    builder.button(text="завершить", callback_data=LiveQuizCallbackData(action="stop"))
 
     return builder.adjust(2).as_markup()
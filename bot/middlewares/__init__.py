@@ -1,5 +1,10 @@
-from .db import DbSessionMiddleware
+from .db import DbSessionMiddleware, LazySession
+from .metrics import UpdateMetricsMiddleware, HandlerMetricsMiddleware, BotApiMetricsMiddleware
 
 __all__ = [
-    "DbSessionMiddleware"
+    "DbSessionMiddleware",
+    "LazySession",
+    "UpdateMetricsMiddleware",
+    "HandlerMetricsMiddleware",
+    "BotApiMetricsMiddleware"
 ]
\ No newline at end of file
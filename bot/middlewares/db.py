@@ -2,7 +2,41 @@ from typing import Callable, Awaitable, Dict, Any
 
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy import event as sa_event
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+
+class LazySession:
+    """
+    Заменяет AsyncSession в обработчиках: сессия создаётся при первом обращении к ней,
+    поэтому обновления, которым база не нужна, не открывают и не закрывают сессию.
+    Открытие сессии и число запросов учитываются по обработчикам в HandlerMetricsMiddleware
+    """
+
+    def __init__(self, session_pool: async_sessionmaker):
+        self._session_pool = session_pool
+        self._session = None
+        self.queries = 0
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    def _get_session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_pool()
+            sa_event.listen(self._session.sync_session, "do_orm_execute", self._count_query)
+        return self._session
+
+    def _count_query(self, orm_execute_state):
+        self.queries += 1
+
+    def __getattr__(self, name):
+        return getattr(self._get_session(), name)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
 
 
 class DbSessionMiddleware(BaseMiddleware):
@@ -16,6 +50,9 @@ class DbSessionMiddleware(BaseMiddleware):
             event: TelegramObject,
             data: Dict[str, Any],
     ) -> Any:
-        async with self.session_pool() as session:
-            data["session"] = session
+        session = LazySession(self.session_pool)
+        data["session"] = session
+        try:
             return await handler(event, data)
+        finally:
+            await session.close()
@@ -0,0 +1,79 @@
+import time
+from typing import Callable, Awaitable, Dict, Any
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod, Response
+from aiogram.types import TelegramObject, Update
+
+from bot.utils import metrics
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Число обновлений и время их обработки по типам; регистрируется на dp.update"""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any],
+    ) -> Any:
+        update_type = event.event_type
+        metrics.updates.inc(update_type)
+        started = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.update_seconds.observe(time.monotonic() - started, update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время работы, исключения, открытые сессии базы и SQL-запросы каждого обработчика;
+    регистрируется на dp.message, dp.poll_answer и т.д.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        # Имя модуля нужно: в разных роутерах есть обработчики с одинаковыми именами
+        name = f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+        # LazySession из DbSessionMiddleware: открывается, только если обработчику нужна база
+        session = data.get("session")
+        opened_before = session is not None and session.opened
+        queries_before = session.queries if session is not None else 0
+        started = time.monotonic()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            metrics.handler_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            metrics.handler_seconds.observe(time.monotonic() - started, name)
+            if session is not None:
+                metrics.handler_db_sessions.inc(name, amount=int(session.opened and not opened_before))
+                metrics.handler_db_queries.inc(name, amount=session.queries - queries_before)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Время и ошибки запросов к Bot API по методам; регистрируется на bot.session"""
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType,
+            bot: Bot,
+            method: TelegramMethod,
+    ) -> Response:
+        name = method.__api_method__
+        started = time.monotonic()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.bot_api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            metrics.bot_api_seconds.observe(time.monotonic() - started, name)
@@ -0,0 +1,72 @@
+# Распределение обновлений между процессами-обработчиками в режиме webhook.
+# В режиме polling процесс один, и все функции работают локально
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Номер текущего процесса и общее число процессов
+shard_id = 0
+shard_count = 1
+# Очереди входящих сообщений всех процессов (multiprocessing.Queue)
+_inboxes = []
+# Название события -> обработчик
+_event_handlers = {}
+
+
+def configure(current_shard_id: int, inboxes: list):
+    global shard_id, shard_count, _inboxes
+    shard_id = current_shard_id
+    shard_count = len(inboxes)
+    _inboxes = inboxes
+
+
+def shard_for(user_id: int) -> int:
+    """Процесс, который обрабатывает все обновления пользователя"""
+    return user_id % shard_count
+
+
+def is_local(user_id: int) -> bool:
+    return shard_for(user_id) == shard_id
+
+
+def update_owner(update: dict) -> int:
+    """Возвращает id пользователя (или чата), по которому шардируется обновление"""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        for field in ("from", "user"):
+            if isinstance(value.get(field), dict) and "id" in value[field]:
+                return value[field]["id"]
+        if isinstance(value.get("chat"), dict) and "id" in value["chat"]:
+            return value["chat"]["id"]
+        if isinstance(value.get("message"), dict) and isinstance(value["message"].get("chat"), dict):
+            return value["message"]["chat"]["id"]
+    return 0
+
+
+def on_event(name: str):
+    """Регистрирует обработчик события, которое приходит от других процессов"""
+    def decorator(handler):
+        _event_handlers[name] = handler
+        return handler
+    return decorator
+
+
+def publish(name: str, shard: int = None, **payload):
+    """
+    Отправляет событие другому процессу или, если shard не указан, всем остальным процессам
+    :param name: название события
+    :param shard: номер процесса-получателя
+    """
+    targets = range(shard_count) if shard is None else [shard]
+    for target in targets:
+        if target != shard_id:
+            _inboxes[target].put_nowait({"event": name, "payload": payload})
+
+
+async def handle_event(event: dict, **kwargs):
+    handler = _event_handlers.get(event["event"])
+    if handler is None:
+        logger.warning("No handler for event %s", event["event"])
+        return
+    await handler(**kwargs, **event["payload"])
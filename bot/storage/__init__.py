@@ -0,0 +1,11 @@
+from .base import StateStore
+from .fsm import StoreFsmStorage
+from .memory import MemoryStateStore
+from .sqlite import SqliteStateStore
+
+__all__ = [
+    "StateStore",
+    "StoreFsmStorage",
+    "MemoryStateStore",
+    "SqliteStateStore"
+]
@@ -0,0 +1,28 @@
+class StateStore:
+    """
+    Хранилище состояния бота: пространства имён, в каждом - строковые ключи и JSON-совместимые значения.
+    Запись синхронная (реализация может откладывать её), чтение - асинхронное
+    """
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get(self, namespace: str, key: str, default=None):
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value):
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    async def items(self, namespace: str) -> list:
+        """Возвращает все пары (ключ, значение) пространства имён"""
+        raise NotImplementedError
+
+    async def keys(self, namespace: str, prefix: str = "") -> list:
+        """Возвращает ключи пространства имён, которые начинаются с prefix"""
+        return [key for key, _ in await self.items(namespace) if key.startswith(prefix)]
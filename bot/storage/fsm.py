@@ -0,0 +1,37 @@
+from typing import Any, Dict, Optional, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType, DefaultKeyBuilder
+
+from bot.storage.base import StateStore
+
+
+class StoreFsmStorage(BaseStorage):
+    """FSM-хранилище aiogram поверх StateStore"""
+
+    def __init__(self, store: StateStore):
+        self.store = store
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        if state is None:
+            self.store.delete("fsm_state", self.key_builder.build(key))
+        else:
+            self.store.set("fsm_state", self.key_builder.build(key), state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.store.get("fsm_state", self.key_builder.build(key))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if data:
+            self.store.set("fsm_data", self.key_builder.build(key), dict(data))
+        else:
+            self.store.delete("fsm_data", self.key_builder.build(key))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict(await self.store.get("fsm_data", self.key_builder.build(key), {}))
+
+    async def close(self) -> None:
+        # Хранилище закрывает приложение после остальных обработчиков остановки, которые ещё могут в него писать
+        pass
@@ -0,0 +1,20 @@
+from bot.storage.base import StateStore
+
+
+class MemoryStateStore(StateStore):
+    """Состояние только в памяти процесса, теряется при перезапуске"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, namespace: str, key: str, default=None):
+        return self.data.get(namespace, {}).get(key, default)
+
+    def set(self, namespace: str, key: str, value):
+        self.data.setdefault(namespace, {})[key] = value
+
+    def delete(self, namespace: str, key: str):
+        self.data.get(namespace, {}).pop(key, None)
+
+    async def items(self, namespace: str) -> list:
+        return list(self.data.get(namespace, {}).items())
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+
+from sqlalchemy import select, delete, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.db.models import StateEntry
+from bot.storage.base import StateStore
+
+logger = logging.getLogger(__name__)
+
+# Отметка об удалении ключа в очереди записи
+_DELETED = object()
+
+
+class SqliteStateStore(StateStore):
+    """
+    Состояние в таблице state базы SQLite.
+    Чтение идёт через кэш в памяти на cache_size последних ключей, записи копятся и сбрасываются
+    в базу одной транзакцией раз в flush_interval секунд: несколько изменений одного ключа превращаются в одну запись
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, flush_interval: float, cache_size: int = 50000):
+        self.session_pool = session_pool
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        # (namespace, key) -> значение; None - ключа нет в базе. Порядок элементов - порядок использования
+        self._cache = OrderedDict()
+        # (namespace, key) -> значение или _DELETED, ещё не записанные в базу; при чтении важнее кэша
+        self._dirty = {}
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def _remember(self, cache_key: tuple, value):
+        self._cache[cache_key] = value
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, namespace: str, key: str, default=None):
+        cache_key = (namespace, key)
+        if cache_key in self._dirty:
+            value = self._dirty[cache_key]
+            return default if value is _DELETED else value
+        if cache_key in self._cache:
+            self._cache.move_to_end(cache_key)
+        else:
+            async with self.session_pool() as session:
+                value = await session.scalar(
+                    select(StateEntry.value).filter_by(namespace=namespace, key=key)
+                )
+            value = None if value is None else json.loads(value)
+            # Пока шёл запрос, ключ мог быть записан или удалён
+            if cache_key in self._dirty:
+                return await self.get(namespace, key, default)
+            if cache_key not in self._cache:
+                self._remember(cache_key, value)
+        value = self._cache[cache_key]
+        return default if value is None else value
+
+    def set(self, namespace: str, key: str, value):
+        self._remember((namespace, key), value)
+        self._dirty[(namespace, key)] = value
+
+    def delete(self, namespace: str, key: str):
+        # Пока удаление не записано, его видно через _dirty; в кэше удалённые ключи не хранятся
+        self._cache.pop((namespace, key), None)
+        self._dirty[(namespace, key)] = _DELETED
+
+    async def items(self, namespace: str) -> list:
+        async with self.session_pool() as session:
+            rows = (await session.execute(
+                select(StateEntry.key, StateEntry.value).filter_by(namespace=namespace)
+            )).all()
+        result = {key: json.loads(value) for key, value in rows}
+        # Учитываем изменения, которые ещё не записаны
+        for (dirty_namespace, key), value in self._dirty.items():
+            if dirty_namespace != namespace:
+                continue
+            if value is _DELETED:
+                result.pop(key, None)
+            else:
+                result[key] = value
+        for key, value in result.items():
+            self._remember((namespace, key), value)
+        return list(result.items())
+
+    async def keys(self, namespace: str, prefix: str = "") -> list:
+        # Значения не нужны, поэтому и в кэш ничего не попадает
+        async with self.session_pool() as session:
+            keys = set(await session.scalars(
+                select(StateEntry.key).filter_by(namespace=namespace)
+                .where(StateEntry.key.startswith(prefix, autoescape=True))
+            ))
+        for (dirty_namespace, key), value in self._dirty.items():
+            if dirty_namespace != namespace or not key.startswith(prefix):
+                continue
+            if value is _DELETED:
+                keys.discard(key)
+            else:
+                keys.add(key)
+        return list(keys)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush state")
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        upserts = [
+            {"namespace": namespace, "key": key, "value": json.dumps(value)}
+            for (namespace, key), value in dirty.items() if value is not _DELETED
+        ]
+        deletes = [cache_key for cache_key, value in dirty.items() if value is _DELETED]
+        try:
+            async with self.session_pool() as session:
+                if upserts:
+                    statement = insert(StateEntry)
+                    await session.execute(
+                        statement.on_conflict_do_update(
+                            index_elements=[StateEntry.namespace, StateEntry.key],
+                            set_={"value": statement.excluded.value}
+                        ),
+                        upserts
+                    )
+                if deletes:
+                    await session.execute(
+                        delete(StateEntry).where(tuple_(StateEntry.namespace, StateEntry.key).in_(deletes))
+                    )
+                await session.commit()
+        except Exception:
+            # Возвращаем изменения в очередь, не затирая более свежие
+            for cache_key, value in dirty.items():
+                self._dirty.setdefault(cache_key, value)
+            raise
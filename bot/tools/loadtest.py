@@ -0,0 +1,482 @@
+# Нагрузочный тест бота целиком: настоящий Dispatcher в режиме polling и локальный сервер вместо Bot API
+# с задержками и ответами 429. Тысячи синтетических студентов заходят по ссылке-приглашению, вводят имя
+# и отвечают на вопросы. Работает без сети. Запуск: python -m bot.tools.loadtest --students 1000
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+from aiogram.utils.payload import encode_payload
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from bot import config
+from bot.app import create_bot, create_dispatcher
+from bot.db import Base, Quiz
+from bot.db import questions as question_repository
+from bot.db.models import Stat, AnswerEvent
+from bot.ui_commands import set_ui_commands
+from bot.utils import scoreboard
+
+TEACHER_ID = 1
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Quiz Wings", "username": "loadtest_bot"}
+CORRECT_TEXT = "Москва"
+
+
+def _percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """0, если запрос можно выполнить сейчас, иначе через сколько секунд повторить"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class FakeBotApi:
+    """
+    Сервер с интерфейсом Bot API: отвечает с задержкой, как настоящий, и возвращает 429,
+    если бот отправляет сообщения быстрее лимитов. Входящие обновления отдаются через getUpdates
+    """
+
+    def __init__(self, latency_ms: float, global_rate: float, chat_rate: float, chat_burst: float,
+                 flood_rate: float, on_call):
+        self.latency = latency_ms / 1000
+        self.global_limit = TokenBucket(global_rate, global_rate) if global_rate else None
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_limits = {}
+        self.flood_rate = flood_rate
+        # on_call(method, params, result) - студенты реагируют на то, что им прислал бот
+        self.on_call = on_call
+        self.calls = Counter()
+        self.flood_errors = Counter()
+        self.message_ids = itertools.count(1)
+        self.poll_ids = itertools.count(1)
+        self.update_ids = itertools.count(1)
+        self.updates = []
+        self.has_updates = asyncio.Event()
+        self.polling_started = asyncio.Event()
+        self.runner = None
+
+    async def start(self) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        await web.SockSite(self.runner, sock).start()
+        return "http://127.0.0.1:%d" % sock.getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def push_update(self, **update):
+        update["update_id"] = next(self.update_ids)
+        # Лишнее поле: по нему бот считает, сколько обновление ждало обработки
+        update["pushed_at"] = time.time()
+        self.updates.append(update)
+        self.has_updates.set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+
+        if method == "getupdates":
+            return self._ok(await self._get_updates(params.get("offset", 0), params.get("timeout", 0)))
+
+        self.calls[method] += 1
+        await asyncio.sleep(random.lognormvariate(math.log(self.latency), 0.5))
+        chat_id = params.get("chat_id")
+        if method.startswith("send") and isinstance(chat_id, int):
+            retry_after = self._throttle(chat_id)
+            if retry_after:
+                self.flood_errors[method] += 1
+                return web.json_response({"ok": False, "error_code": 429,
+                                          "description": f"Too Many Requests: retry after {retry_after}",
+                                          "parameters": {"retry_after": retry_after}})
+        result = self._result(method, params)
+        self.on_call(method, params, result)
+        return self._ok(result)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, offset: int, timeout: int) -> list:
+        self.polling_started.set()
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates:
+            self.has_updates.clear()
+            try:
+                await asyncio.wait_for(self.has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:100]
+
+    def _throttle(self, chat_id: int) -> int:
+        if self.flood_rate and random.random() < self.flood_rate:
+            return 1
+        limit = self.chat_limits.get(chat_id)
+        if limit is None:
+            limit = self.chat_limits[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        wait = limit.take()
+        if not wait and self.global_limit is not None:
+            wait = self.global_limit.take()
+        return math.ceil(wait)
+
+    def _result(self, method: str, params: dict):
+        if method == "getme":
+            return BOT_USER
+        if not method.startswith(("send", "edit", "stop")) or "chat_id" not in params:
+            return True
+        chat_id = params["chat_id"]
+        message = {
+            "message_id": params.get("message_id") or next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "from": BOT_USER,
+        }
+        if method == "sendpoll":
+            message["poll"] = self._poll(params)
+        elif method == "stoppoll":
+            return self._poll(params, closed=True)
+        elif method == "sendsticker":
+            message["sticker"] = {"file_id": "sticker", "file_unique_id": "sticker", "type": "regular",
+                                  "width": 512, "height": 512, "is_animated": True, "is_video": False}
+        elif method == "sendphoto":
+            message["photo"] = [{"file_id": "photo", "file_unique_id": "photo", "width": 512, "height": 512}]
+        elif method == "senddocument":
+            message["document"] = {"file_id": "document", "file_unique_id": "document"}
+        else:
+            message["text"] = params.get("text") or params.get("caption") or ""
+        return message
+
+    def _poll(self, params: dict, closed: bool = False) -> dict:
+        options = params.get("options") or []
+        return {
+            "id": str(next(self.poll_ids)),
+            "question": params.get("question", ""),
+            "options": [{"persistent_id": str(i), "text": option["text"] if isinstance(option, dict) else option,
+                         "voter_count": 0} for i, option in enumerate(options)],
+            "total_voter_count": 0,
+            "is_closed": closed,
+            "is_anonymous": False,
+            "type": "regular",
+            "allows_multiple_answers": True,
+            "allows_revoting": True,
+            "members_only": False,
+        }
+
+
+class Students:
+    """
+    Синтетические студенты и преподаватель: реагируют на то, что им присылает бот, и отвечают
+    через getUpdates. Работают в отдельном процессе вместе с FakeBotApi, чтобы не отнимать
+    процессорное время у бота
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.api = FakeBotApi(args.latency, args.global_rate, args.chat_rate, args.chat_burst, args.flood_rate,
+                              self.on_call)
+        self.students = range(1000, 1000 + args.students)
+        self.joined = set()
+        self.finished = set()
+        self.all_joined = asyncio.Event()
+        self.all_finished = asyncio.Event()
+        self.tasks = set()
+
+    def _later(self, delay: float, callback, *args):
+        async def run():
+            await asyncio.sleep(delay)
+            callback(*args)
+
+        task = asyncio.create_task(run())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _think(self) -> float:
+        return random.uniform(self.args.think_min, self.args.think_max)
+
+    def send_text(self, user_id: int, text: str):
+        user = {"id": user_id, "is_bot": False, "first_name": f"Студент {user_id}"}
+        self.api.push_update(message={
+            "message_id": next(self.api.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": text,
+        })
+
+    def answer_poll(self, user_id: int, poll: dict):
+        option_ids = [1] if random.random() < self.args.correct_rate else [0]
+        self.api.push_update(poll_answer={
+            "poll_id": poll["id"],
+            "user": {"id": user_id, "is_bot": False, "first_name": f"Студент {user_id}"},
+            "option_ids": option_ids,
+            "option_persistent_ids": [str(i) for i in option_ids],
+        })
+
+    def answer_written(self, user_id: int):
+        # Часть студентов отвечает с опечаткой или в другом регистре
+        text = random.choice([CORRECT_TEXT, CORRECT_TEXT.lower(), "Масква", "москва!"]) \
+            if random.random() < self.args.correct_rate else "Санкт-Петербург"
+        self.send_text(user_id, text)
+
+    def on_call(self, method: str, params: dict, result):
+        chat_id = params.get("chat_id")
+        if chat_id not in self.students:
+            return
+        if method == "sendpoll":
+            self._later(self._think(), self.answer_poll, chat_id, result["poll"])
+            return
+        text = params.get("text") or params.get("caption") or ""
+        if method != "sendmessage" and method != "sendphoto":
+            return
+        if text.startswith("Пожалуйста, введите ваше имя"):
+            self._later(self._think(), self.send_text, chat_id, f"Студент {chat_id} {5400 + chat_id % 10}")
+        elif "вы добавлены к викторине" in text:
+            self.joined.add(chat_id)
+            if len(self.joined) == len(self.students):
+                self.all_joined.set()
+        elif text.startswith("Вопрос "):
+            self._later(self._think(), self.answer_written, chat_id)
+        elif text.startswith("Викторина завершена"):
+            self.finished.add(chat_id)
+            if len(self.finished) == len(self.students):
+                self.all_finished.set()
+
+    async def run(self, quiz_id: int) -> dict:
+        await self.api.polling_started.wait()
+        started = time.monotonic()
+        # Студенты приходят по ссылке-приглашению в течение ramp секунд
+        payload = encode_payload(str(quiz_id))
+        for user_id in self.students:
+            self._later(random.uniform(0, self.args.ramp), self.send_text, user_id, f"/start {payload}")
+        # Кто не записался за это время, уже не запишется - начинаем с теми, кто есть
+        try:
+            await asyncio.wait_for(self.all_joined.wait(), self.args.ramp + 2 * self.args.think_max + 30)
+        except asyncio.TimeoutError:
+            pass
+        join_time = time.monotonic() - started
+
+        self.send_text(TEACHER_ID, f"/quiz_start {quiz_id}")
+        try:
+            await asyncio.wait_for(self.all_finished.wait(), max(0.0, self.args.timeout - join_time))
+        except asyncio.TimeoutError:
+            pass
+        for task in list(self.tasks):
+            task.cancel()
+        return {"students": len(self.students), "joined": len(self.joined), "finished": len(self.finished),
+                "join_time": join_time, "elapsed": time.monotonic() - started}
+
+
+def _run_students(args, quiz_id: int, connection):
+    """Процесс с FakeBotApi и студентами; общается с основным процессом через connection"""
+    async def serve():
+        random.seed(args.seed)
+        students = Students(args)
+        connection.send(await students.api.start())
+        connection.send(await students.run(quiz_id))
+        # Сервер работает, пока бот не остановится: при остановке он ещё обращается к Bot API
+        await asyncio.get_running_loop().run_in_executor(None, connection.recv)
+        await students.api.stop()
+        connection.send({"calls": students.api.calls, "flood_errors": students.api.flood_errors})
+
+    asyncio.run(serve())
+
+
+class LoadTest:
+    """Настоящий бот из bot.app в режиме polling и замеры времени его обработчиков"""
+
+    def __init__(self, args):
+        self.args = args
+        # Тип обновления -> [ожидание от появления обновления до начала обработки, мс]
+        self.queue_ms = defaultdict(list)
+        # Обработчик -> [время обработки, мс]
+        self.handler_ms = defaultdict(list)
+        self.updates = 0
+        self.errors = Counter()
+        # Тип исключения -> текст первого такого исключения
+        self.error_samples = {}
+
+    async def measure_update(self, handler, update, data):
+        """Внешний middleware: сколько обновление ждало обработки и чем закончилась обработка"""
+        self.updates += 1
+        pushed_at = (update.model_extra or {}).get("pushed_at")
+        if pushed_at is not None:
+            self.queue_ms[update.event_type].append((time.time() - pushed_at) * 1000)
+        try:
+            return await handler(update, data)
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+            self.error_samples.setdefault(type(e).__name__, str(e).splitlines()[0])
+            raise
+
+    async def measure_handler(self, handler, event, data):
+        """Внутренний middleware: время работы каждого обработчика"""
+        started = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            self.handler_ms[data["handler"].callback.__name__].append((time.monotonic() - started) * 1000)
+
+    async def create_quiz(self) -> int:
+        questions = []
+        for i in range(self.args.questions):
+            if i % 2 == 0:
+                question = {"type": "multiple_choice", "question": f"Вопрос {i + 1}", "options": ["Нет", "Да"],
+                            "correct": [1]}
+            else:
+                question = {"type": "written", "question": "Столица России?", "options": [], "correct": CORRECT_TEXT}
+            if self.args.time_limit:
+                question["time_limit"] = self.args.time_limit
+            questions.append(question)
+
+        engine = create_async_engine(config.db_url)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            quiz = Quiz(name="Нагрузочный тест", user_id=TEACHER_ID, active=False)
+            session.add(quiz)
+            await question_repository.add_questions(session, quiz, questions)
+            quiz_id = quiz.id
+            await session.commit()
+        await engine.dispose()
+        return quiz_id
+
+    async def saved_rows(self) -> tuple:
+        engine = create_async_engine(config.db_url)
+        async with engine.connect() as connection:
+            stats = await connection.scalar(select(func.count(Stat.id)))
+            answers = await connection.scalar(select(func.count(AnswerEvent.id)))
+        await engine.dispose()
+        return stats, answers
+
+    async def run(self) -> bool:
+        quiz_id = await self.create_quiz()
+        connection, child_connection = multiprocessing.Pipe()
+        process = multiprocessing.get_context("spawn").Process(
+            target=_run_students, args=(self.args, quiz_id, child_connection), daemon=True)
+        process.start()
+        loop = asyncio.get_running_loop()
+        config.bot_token = "42:LOADTEST"
+        config.bot_api_url = await loop.run_in_executor(None, connection.recv)
+
+        # Как в bot.__main__.main
+        bot = create_bot()
+        dp = await create_dispatcher()
+        await set_ui_commands(bot)
+        if self.args.verbose:
+            scoreboard.set_verbose(quiz_id, True)
+        dp.update.outer_middleware(self.measure_update)
+        for update_type in dp.resolve_used_update_types():
+            dp.observers[update_type].middleware(self.measure_handler)
+        polling = asyncio.create_task(dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types(),
+                                                       handle_signals=False))
+
+        summary = await loop.run_in_executor(None, connection.recv)
+        # Последнее обновление сводки у преподавателя, пока сервер ещё отвечает
+        await scoreboard.close_scoreboard(quiz_id)
+        await dp.stop_polling()
+        await polling
+        connection.send("stop")
+        summary.update(await loop.run_in_executor(None, connection.recv))
+        process.join()
+        summary["stats"], summary["answers"] = await self.saved_rows()
+
+        self.report(summary)
+        return summary["finished"] == summary["students"] and not self.errors
+
+    def report(self, summary: dict):
+        elapsed = summary["elapsed"]
+        print(f"Студентов: {summary['students']}, записались: {summary['joined']} за {summary['join_time']:.1f} с, "
+              f"закончили: {summary['finished']}")
+        print(f"Обновлений: {self.updates} за {elapsed:.1f} с, {self.updates / elapsed:.0f} в секунду")
+        print(f"Сохранено результатов: {summary['stats']}, ответов в журнале: {summary['answers']}")
+        print("Ожидание обработки, p95: " + ", ".join(
+            f"{event_type} {_percentile(sorted(values), 95):.0f} мс" for event_type, values in self.queue_ms.items()))
+        print(f"{'обработчик':<24}{'число':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+        for name, values in sorted(self.handler_ms.items()):
+            values.sort()
+            print(f"{name:<24}{len(values):>8}{_percentile(values, 50):>10.1f}{_percentile(values, 95):>10.1f}"
+                  f"{_percentile(values, 99):>10.1f}")
+        print("Вызовы Bot API: " + ", ".join(f"{method} {count}" for method, count in summary["calls"].most_common()))
+        if summary["flood_errors"]:
+            print("Ответы 429: " + ", ".join(f"{method} {count}"
+                                            for method, count in summary["flood_errors"].most_common()))
+        if self.errors:
+            print("Ошибки в обработчиках:")
+            for name, count in self.errors.most_common():
+                print(f"  {name} x{count}: {self.error_samples[name]}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с локальным Bot API")
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--time-limit", type=int, default=None, help="секунд на каждый вопрос")
+    parser.add_argument("--ramp", type=float, default=10, help="за сколько секунд приходят все студенты")
+    parser.add_argument("--think-min", type=float, default=5, help="минимальное время на ответ, с")
+    parser.add_argument("--think-max", type=float, default=15, help="максимальное время на ответ, с")
+    parser.add_argument("--correct-rate", type=float, default=0.7, help="доля правильных ответов")
+    parser.add_argument("--verbose", action="store_true", help="уведомлять преподавателя о каждом ответе")
+    parser.add_argument("--latency", type=float, default=40, help="медианная задержка Bot API, мс")
+    # Лимиты из документации Telegram; при --global-rate 0 меряется только сам бот
+    parser.add_argument("--global-rate", type=float, default=30, help="сообщений в секунду на бота, 0 - без лимита")
+    parser.add_argument("--chat-rate", type=float, default=1, help="сообщений в секунду в один чат")
+    parser.add_argument("--chat-burst", type=float, default=5, help="сколько сообщений в чат можно отправить подряд")
+    parser.add_argument("--flood-rate", type=float, default=0, help="доля случайных ответов 429")
+    parser.add_argument("--timeout", type=float, default=300, help="предельная длительность теста, с")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    random.seed(args.seed)
+    # Исключения в обработчиках считаются в отчёте, без трассировки на каждое
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("aiogram.event").setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directory:
+        config.db_url = f"sqlite+aiosqlite:///{os.path.join(directory, 'loadtest.db')}"
+        ok = await LoadTest(args).run()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
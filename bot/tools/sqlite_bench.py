@@ -0,0 +1,94 @@
+# Нагрузочный тест записи в SQLite: студенты одновременно заканчивают викторину и сохраняют результат,
+# пока преподаватель листает статистику. Запуск: python -m bot.tools.sqlite_bench [студентов] [читателей]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from bot import config
+from bot.db import Base
+from bot.db.engine import create_sessionmaker, dispose
+from bot.db.models import Stat
+from bot.db.writer import BatchWriter
+
+
+def _stat(i: int) -> dict:
+    return dict(user_id=i, name=f"Студент {i}", quiz_id=1, correct_count=i % 10, total_questions=10,
+                display_name=f"Студент {i}", group_number=5400 + i % 7)
+
+
+async def _commit_each(session_pool, students: int, errors: list):
+    # Как было до пакетной записи: каждый результат - отдельная транзакция
+    async def finish(i):
+        try:
+            async with session_pool() as session:
+                session.add(Stat(**_stat(i)))
+                await session.commit()
+        except OperationalError as e:
+            errors.append(e)
+
+    await asyncio.gather(*(finish(i) for i in range(students)))
+
+
+async def _batched(session_pool, students: int, errors: list):
+    # Без паузы перед записью, чтобы мерить саму базу, а не flush_interval
+    writer = BatchWriter(session_pool, Stat, config.stat_batch_size, 0)
+    await writer.start()
+    for i in range(students):
+        writer.put(**_stat(i))
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    await writer.stop()
+
+
+async def _read(session_pool, stop: asyncio.Event, counter: list):
+    while not stop.is_set():
+        async with session_pool() as session:
+            await session.execute(select(Stat.group_number, func.count()).group_by(Stat.group_number))
+        counter[0] += 1
+        # Преподаватель листает страницы, а не опрашивает базу непрерывно
+        await asyncio.sleep(0.01)
+
+
+async def run(mode: str, write, students: int, readers: int):
+    config.sqlite_mode = mode
+    with tempfile.TemporaryDirectory() as directory:
+        config.db_url = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+        engine = create_async_engine(config.db_url)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        await engine.dispose()
+        session_pool = create_sessionmaker()
+
+        stop = asyncio.Event()
+        reads = [0]
+        errors = []
+        reader_tasks = [asyncio.create_task(_read(session_pool, stop, reads)) for _ in range(readers)]
+        started = time.monotonic()
+        await write(session_pool, students, errors)
+        elapsed = time.monotonic() - started
+        stop.set()
+        await asyncio.gather(*reader_tasks)
+
+        async with session_pool() as session:
+            saved = await session.scalar(select(func.count(Stat.id)))
+        await dispose(session_pool)
+
+    print(f"{mode:>8} {write.__name__:>13}: {saved} из {students} за {elapsed:.2f} с, "
+          f"{saved / elapsed:.0f} результатов/с, {reads[0] / elapsed:.0f} чтений/с, ошибок: {len(errors)}")
+
+
+async def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    for mode, write in [("default", _commit_each), ("wal", _commit_each), ("default", _batched), ("wal", _batched)]:
+        await run(mode, write, students, readers)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,17 +1,40 @@
+import hashlib
+import json
+
 from aiogram import Bot
-from aiogram.types import BotCommandScopeAllPrivateChats, BotCommand
+from aiogram.types import BotCommandScopeAllPrivateChats, BotCommandScopeAllGroupChats, BotCommand
+
+from bot.utils import run_state
+
+
+def get_ui_commands() -> list:
+    """
+    Bot commands shown in UI
+    :return: list of (commands, scope)
+    """
+    return [
+        ([
+            BotCommand(command="create_quiz", description="новая викторина"),
+            BotCommand(command="my_quizzes", description="мои викторины"),
+            BotCommand(command="import_quiz", description="импорт викторины из файла"),
+        ], BotCommandScopeAllPrivateChats()),
+        # Викторину в групповом чате запускает преподаватель
+        ([BotCommand(command="quiz_live", description="провести викторину в этом чате")],
+         BotCommandScopeAllGroupChats()),
+    ]
 
 
 async def set_ui_commands(bot: Bot):
     """
-    Sets bot commands in UI
+    Sets bot commands in UI. Skipped when the same commands were already set for this bot:
+    the hash of the last set is kept in the state store
     :param bot: Bot instance
     """
-    commands = [
-        BotCommand(command="create_quiz", description="новая викторина"),
-        BotCommand(command="my_quizzes", description="мои викторины"),
-    ]
-    await bot.set_my_commands(
-        commands=commands,
-        scope=BotCommandScopeAllPrivateChats()
-    )
+    command_sets = get_ui_commands()
+    dump = [([command.model_dump() for command in commands], scope.model_dump()) for commands, scope in command_sets]
+    digest = hashlib.sha256(json.dumps(dump, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+    if await run_state.store.get("bot", f"commands:{bot.id}") == digest:
+        return
+    for commands, scope in command_sets:
+        await bot.set_my_commands(commands=commands, scope=scope)
+    run_state.store.set("bot", f"commands:{bot.id}", digest)
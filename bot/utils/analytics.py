@@ -0,0 +1,194 @@
+# Статистика по вопросам: счётчики обновляются при каждом ответе, в базу сохраняется снимок
+import asyncio
+import bisect
+import html
+import logging
+
+from bot import sharding
+from bot.utils import run_state
+
+logger = logging.getLogger(__name__)
+
+# Границы интервалов времени ответа в миллисекундах; последний интервал - всё, что дольше
+LATENCY_BUCKETS = [1000, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 45000, 60000, 120000, 300000]
+
+
+class QuestionStats:
+    def __init__(self, data: dict = None):
+        data = data or {}
+        self.answered = data.get("answered", 0)
+        self.correct = data.get("correct", 0)
+        # номер варианта (строкой, как в JSON) -> сколько раз выбран
+        self.option_picks = data.get("option_picks", {})
+        self.latency_count = data.get("latency_count", 0)
+        self.latency_sum = data.get("latency_sum", 0)
+        self.latency_histogram = data.get("latency_histogram", [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def record(self, correct: bool, options=None, latency_ms: int = None):
+        self.answered += 1
+        if correct:
+            self.correct += 1
+        for option in options or ():
+            self.option_picks[str(option)] = self.option_picks.get(str(option), 0) + 1
+        if latency_ms is not None:
+            self.latency_count += 1
+            self.latency_sum += latency_ms
+            self.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS, latency_ms)] += 1
+
+    @property
+    def correct_rate(self) -> float:
+        return self.correct / self.answered if self.answered else 0.0
+
+    @property
+    def mean_latency_ms(self):
+        return self.latency_sum / self.latency_count if self.latency_count else None
+
+    def latency_percentile_ms(self, percentile: float):
+        """Верхняя граница интервала, в который попадает перцентиль; None для последнего интервала"""
+        if not self.latency_count:
+            return None
+        threshold = self.latency_count * percentile / 100
+        seen = 0
+        for i, count in enumerate(self.latency_histogram):
+            seen += count
+            if seen >= threshold:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else None
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "answered": self.answered,
+            "correct": self.correct,
+            "option_picks": self.option_picks,
+            "latency_count": self.latency_count,
+            "latency_sum": self.latency_sum,
+            "latency_histogram": self.latency_histogram,
+        }
+
+
+class QuizAnalytics:
+    def __init__(self, data: dict = None):
+        # номер вопроса -> QuestionStats
+        self.questions = {int(index): QuestionStats(stats) for index, stats in (data or {}).items()}
+
+    def question(self, index: int) -> QuestionStats:
+        stats = self.questions.get(index)
+        if stats is None:
+            stats = self.questions[index] = QuestionStats()
+        return stats
+
+    def to_dict(self) -> dict:
+        return {str(index): stats.to_dict() for index, stats in self.questions.items()}
+
+
+# quiz_id -> QuizAnalytics
+analytics = {}
+# Викторины, изменившиеся после последнего снимка
+_dirty = set()
+_task = None
+
+
+async def get(quiz_id: int) -> QuizAnalytics:
+    """Статистика викторины из памяти, а если её там нет - из последнего снимка"""
+    quiz_analytics = analytics.get(quiz_id)
+    if quiz_analytics is None:
+        data = await run_state.store.get("analytics", str(quiz_id))
+        # Пока читали снимок, статистику мог создать другой ответ
+        quiz_analytics = analytics.setdefault(quiz_id, QuizAnalytics(data))
+    return quiz_analytics
+
+
+# Статистика живёт в процессе, который обрабатывает преподавателя, как и сводка
+async def record_answer(owner_id: int, quiz_id: int, question_index: int, correct: bool, options=None,
+                        latency_ms: int = None):
+    if not sharding.is_local(owner_id):
+        sharding.publish("analytics_answer", shard=sharding.shard_for(owner_id), owner_id=owner_id,
+                         quiz_id=quiz_id, question_index=question_index, correct=correct, options=options,
+                         latency_ms=latency_ms)
+        return
+    quiz_analytics = analytics.get(quiz_id) or await get(quiz_id)
+    quiz_analytics.question(question_index).record(correct, options, latency_ms)
+    _dirty.add(quiz_id)
+
+
+@sharding.on_event("analytics_answer")
+async def _on_answer(owner_id: int, quiz_id: int, question_index: int, correct: bool, options=None,
+                     latency_ms: int = None, **kwargs):
+    await record_answer(owner_id, quiz_id, question_index, correct, options, latency_ms)
+
+
+def snapshot():
+    """Сохраняет изменившуюся статистику в хранилище состояния"""
+    for quiz_id in list(_dirty):
+        run_state.store.set("analytics", str(quiz_id), analytics[quiz_id].to_dict())
+    _dirty.clear()
+
+
+async def _run(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            snapshot()
+        except Exception:
+            logger.exception("Failed to snapshot analytics")
+
+
+async def start(interval: float):
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run(interval))
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    snapshot()
+
+
+def _format_seconds(milliseconds) -> str:
+    if milliseconds is None:
+        return f"> {LATENCY_BUCKETS[-1] // 1000} с"
+    return f"{milliseconds / 1000:.1f} с"
+
+
+def render(quiz_analytics: QuizAnalytics, questions: list, max_length: int = 3800) -> list:
+    """Текст статистики по вопросам, разбитый на сообщения не длиннее max_length"""
+    blocks = []
+    for index, question in enumerate(questions):
+        stats = quiz_analytics.questions.get(index)
+        title = html.escape(question["question"][:80])
+        if stats is None or not stats.answered:
+            blocks.append(f"<b>{index + 1}. {title}</b>\nОтветов пока нет")
+            continue
+
+        mark = "⚠️ " if stats.correct_rate < 0.5 else ""
+        lines = [
+            f"<b>{index + 1}. {title}</b>",
+            f"{mark}Правильно: {stats.correct} из {stats.answered} ({stats.correct_rate:.0%})",
+        ]
+        if stats.latency_count:
+            lines.append(f"Время ответа: в среднем {_format_seconds(stats.mean_latency_ms)}, "
+                         f"медиана до {_format_seconds(stats.latency_percentile_ms(50))}, "
+                         f"90% до {_format_seconds(stats.latency_percentile_ms(90))}")
+        if question["type"] == "multiple_choice":
+            correct = set(question["correct"])
+            for option_index, option in enumerate(question["options"]):
+                picks = stats.option_picks.get(str(option_index), 0)
+                lines.append(f"{'✅' if option_index in correct else '▫️'} {html.escape(option)}: {picks}")
+        blocks.append("\n".join(lines))
+
+    if not blocks:
+        return ["В викторине нет вопросов."]
+
+    messages = [""]
+    for block in blocks:
+        if messages[-1] and len(messages[-1]) + len(block) + 2 > max_length:
+            messages.append("")
+        messages[-1] += ("\n\n" if messages[-1] else "") + block
+    return messages
@@ -0,0 +1,115 @@
+# Проверка письменных ответов: правильный ответ разбирается один раз, каждый ответ студента - за микросекунды
+import re
+import unicodedata
+
+# Разделитель нескольких правильных ответов: "Москва; Moscow"
+ANSWER_SEPARATOR = ";"
+
+# Число и необязательный допуск: "3.14", "3,14 ± 0.01", "100 +- 5"
+_NUMBER = re.compile(r"^\s*([-+]?\d+(?:[.,]\d+)?)\s*(?:(?:±|\+-|\+/-)\s*(\d+(?:[.,]\d+)?))?\s*$")
+
+
+def _is_edge(char: str) -> bool:
+    return char.isspace() or unicodedata.category(char)[0] == "P"
+
+
+def normalize(text: str) -> str:
+    """
+    Приводит ответ к виду для сравнения: NFKC, без учёта регистра, ё как е, без лишних пробелов
+    и знаков препинания по краям. Символы внутри ответа сохраняются ("C++" не совпадает с "C"),
+    а ответ из одних знаков ("-") остаётся как есть
+    """
+    text = " ".join(unicodedata.normalize("NFKC", text).casefold().replace("ё", "е").split())
+    start, end = 0, len(text)
+    while start < end and _is_edge(text[start]):
+        start += 1
+    while end > start and _is_edge(text[end - 1]):
+        end -= 1
+    return text[start:end] or text
+
+
+def parse_number(text: str):
+    """(число, допуск) или None, если текст - не число"""
+    match = _NUMBER.match(text)
+    if match is None:
+        return None
+    value, tolerance = match.groups()
+    return float(value.replace(",", ".")), float(tolerance.replace(",", ".")) if tolerance else 0.0
+
+
+def max_typos(answer: str) -> int:
+    """Сколько опечаток прощается; в коротких ответах ни одной, иначе "кот" засчитывался бы за "кит" """
+    if len(answer) <= 4:
+        return 0
+    if len(answer) <= 8:
+        return 1
+    return 2
+
+
+def within_distance(a: str, b: str, limit: int) -> bool:
+    """Расстояние Левенштейна между a и b не больше limit; считается только полоса шириной 2*limit+1"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    if limit == 0:
+        return a == b
+    if len(a) > len(b):
+        a, b = b, a
+    big = limit + 1
+    previous = [j if j <= limit else big for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [big] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        start, end = max(1, i - limit), min(len(b), i + limit)
+        char = a[i - 1]
+        for j in range(start, end + 1):
+            cost = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+        # Все значения в полосе уже больше limit - дальше они только растут
+        if min(current[start - 1:end + 1]) > limit:
+            return False
+        previous = current
+    return previous[len(b)] <= limit
+
+
+class AnswerMatcher:
+    """Правильный письменный ответ, подготовленный для быстрой проверки"""
+
+    def __init__(self, correct: str):
+        # Нормализованные правильные ответы
+        self.exact = set()
+        # [(число, допуск)]
+        self.numbers = []
+        # [(нормализованный ответ, сколько опечаток прощается)]
+        self.fuzzy = []
+        # Ответ целиком тоже правильный: ответы, сохранённые до появления разделителя, могут содержать ";"
+        answers = correct.split(ANSWER_SEPARATOR)
+        if len(answers) > 1:
+            answers.append(correct)
+        for answer in answers:
+            number = parse_number(answer)
+            if number is not None:
+                self.numbers.append(number)
+                continue
+            answer = normalize(answer)
+            if not answer:
+                continue
+            self.exact.add(answer)
+            typos = max_typos(answer)
+            if typos:
+                self.fuzzy.append((answer, typos))
+
+    def match(self, text: str) -> bool:
+        if self.numbers:
+            number = parse_number(text)
+            if number is not None:
+                value = number[0]
+                return any(abs(value - expected) <= tolerance + 1e-9 for expected, tolerance in self.numbers)
+        text = normalize(text)
+        if text in self.exact:
+            return True
+        return any(within_distance(text, answer, typos) for answer, typos in self.fuzzy)
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+
+from bot import config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ограничитель частоты: не больше rate операций в секунду с запасом capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def is_idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class BroadcastResult:
+    def __init__(self):
+        self.sent = []
+        self.failed = {}
+
+    @property
+    def total(self):
+        return len(self.sent) + len(self.failed)
+
+
+class Broadcaster:
+    """
+    Рассылка с лимитом на каждый чат. Общий лимит бота и повторы после 429 и сетевых ошибок -
+    в outbound.queue, через которую проходит каждая отправка
+    """
+
+    def __init__(self, chat_rate: float, concurrency: int):
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Не даём словарю расти бесконечно: выбрасываем чаты, лимит которых уже восстановился
+            if len(self.chat_buckets) >= 10000:
+                for idle_chat_id in [c for c, b in self.chat_buckets.items() if b.is_idle()]:
+                    self.chat_buckets.pop(idle_chat_id)
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    async def send(self, chat_id: int, send):
+        """Вызывает send() с соблюдением лимита чата; send - корутина без аргументов"""
+        async with self._semaphore:
+            await self._chat_bucket(chat_id).acquire()
+            return await send()
+
+    async def broadcast(self, chat_ids, send, on_progress=None) -> BroadcastResult:
+        """
+        Отправляет всем чатам одновременно, насколько позволяют лимиты
+        :param chat_ids: получатели
+        :param send: корутина send(chat_id)
+        :param on_progress: необязательная корутина on_progress(result), вызывается после каждой отправки
+        """
+        result = BroadcastResult()
+
+        async def send_one(chat_id):
+            try:
+                await self.send(chat_id, lambda: send(chat_id))
+                result.sent.append(chat_id)
+            except Exception as e:
+                logger.warning("Broadcast to %s failed: %r", chat_id, e)
+                result.failed[chat_id] = e
+            if on_progress is not None:
+                await on_progress(result)
+
+        await asyncio.gather(*(send_one(chat_id) for chat_id in list(chat_ids)))
+        return result
+
+
+broadcaster = Broadcaster(
+    chat_rate=config.broadcast_chat_rate,
+    concurrency=config.broadcast_concurrency,
+)
@@ -0,0 +1,96 @@
+# Сроки ответа на вопросы: одна куча и один таймер на все сроки вместо задачи на каждого участника
+import asyncio
+import heapq
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Куча (срок, user_id, quiz_id, question_index); срок - time.time(), чтобы его можно было сохранить
+_heap = []
+# user_id -> запись из кучи; у участника не больше одного срока, остальные записи в куче устарели
+_entries = {}
+_timer = None
+_callback = None
+_tasks = set()
+
+
+def schedule(user_id: int, quiz_id: int, question_index: int, deadline: float):
+    """Назначает срок ответа на вопрос; прежний срок участника отменяется"""
+    entry = (deadline, user_id, quiz_id, question_index)
+    _entries[user_id] = entry
+    heapq.heappush(_heap, entry)
+    # Отменённые записи остаются в куче до своего срока; если их стало много, перестраиваем кучу
+    if len(_heap) > 2 * len(_entries) + 1024:
+        _compact()
+    if _heap[0] is entry:
+        _set_timer()
+
+
+def cancel(user_id: int):
+    _entries.pop(user_id, None)
+
+
+def pending() -> int:
+    return len(_entries)
+
+
+def _compact():
+    _heap[:] = _entries.values()
+    heapq.heapify(_heap)
+
+
+def _set_timer():
+    global _timer
+    if _timer is not None:
+        _timer.cancel()
+        _timer = None
+    if _callback is None or not _heap:
+        return
+    loop = asyncio.get_running_loop()
+    _timer = loop.call_later(max(0.0, _heap[0][0] - time.time()), _fire)
+
+
+def _fire():
+    global _timer
+    _timer = None
+    now = time.time()
+    expired = []
+    while _heap and _heap[0][0] <= now:
+        entry = heapq.heappop(_heap)
+        if _entries.get(entry[1]) is entry:
+            del _entries[entry[1]]
+            expired.append(entry[1:])
+    if expired:
+        task = asyncio.create_task(_expire(expired))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+    _set_timer()
+
+
+async def _expire(expired: list):
+    try:
+        await _callback(expired)
+    except Exception:
+        logger.exception("Failed to handle %s expired questions", len(expired))
+
+
+def start(callback):
+    """
+    Запускает таймер
+    :param callback: корутина callback(expired), expired - список (user_id, quiz_id, question_index)
+        всех вопросов, срок которых истёк одновременно
+    """
+    global _callback
+    _callback = callback
+    _set_timer()
+
+
+async def stop():
+    global _callback, _timer
+    _callback = None
+    if _timer is not None:
+        _timer.cancel()
+        _timer = None
+    if _tasks:
+        await asyncio.gather(*_tasks, return_exceptions=True)
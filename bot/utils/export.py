@@ -0,0 +1,100 @@
+# Выгрузка результатов викторины в CSV и XLSX: строки читаются из базы курсором и сразу пишутся в файл
+import csv
+import io
+import json
+
+from sqlalchemy import select, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.db.models import Stat, AnswerEvent, Question
+
+# Сколько строк читать из базы за раз
+YIELD_PER = 500
+
+RESULT_COLUMNS = ["Имя", "Группа", "Telegram ID", "Правильных ответов", "Всего вопросов"]
+ANSWER_COLUMNS = ["Проведение", "Имя", "Telegram ID", "Номер вопроса", "Вопрос", "Ответ", "Правильно",
+                  "Время ответа, с", "Время"]
+
+
+async def _result_rows(session: AsyncSession, quiz_id: int):
+    query = select(Stat).filter_by(quiz_id=quiz_id).order_by(Stat.group_number, Stat.display_name, Stat.id) \
+        .execution_options(yield_per=YIELD_PER)
+    async for stat in await session.stream_scalars(query):
+        yield [stat.display_name, stat.group_number or "", stat.user_id, stat.correct_count, stat.total_questions]
+
+
+async def _answer_rows(session: AsyncSession, quiz_id: int):
+    # Имя берём из последнего результата студента в этой викторине
+    # (подзапрос для каждой строки здесь не годится: по user_id в stats нет индекса)
+    latest = select(Stat.user_id, func.max(Stat.id).label("id")) \
+        .where(Stat.quiz_id == quiz_id).group_by(Stat.user_id).subquery()
+    query = select(AnswerEvent, Stat.display_name, Question.text) \
+        .outerjoin(latest, latest.c.user_id == AnswerEvent.user_id) \
+        .outerjoin(Stat, Stat.id == latest.c.id) \
+        .outerjoin(Question, and_(Question.quiz_id == AnswerEvent.quiz_id,
+                                  Question.position == AnswerEvent.question_index)) \
+        .where(AnswerEvent.quiz_id == quiz_id) \
+        .order_by(AnswerEvent.id) \
+        .execution_options(yield_per=YIELD_PER)
+    async for event, user_name, question_text in await session.stream(query):
+        if event.options is not None:
+            answer = "; ".join(str(option + 1) for option in json.loads(event.options))
+        else:
+            answer = event.text
+        yield [
+            event.run_id,
+            user_name or "",
+            event.user_id,
+            event.question_index + 1,
+            question_text or "",
+            answer,
+            "да" if event.is_correct else "нет",
+            "" if event.latency_ms is None else round(event.latency_ms / 1000, 1),
+            event.created_at.strftime("%Y-%m-%d %H:%M:%S") if event.created_at else ""
+        ]
+
+
+async def has_answers(session: AsyncSession, quiz_id: int) -> bool:
+    query = select(AnswerEvent.id).filter_by(quiz_id=quiz_id).limit(1)
+    return (await session.execute(query)).first() is not None
+
+
+async def _write_csv(rows, columns, file):
+    # utf-8-sig и ";" - чтобы Excel открывал файл с русскими буквами без настройки импорта
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        writer = csv.writer(text, delimiter=";")
+        writer.writerow(columns)
+        async for row in rows:
+            writer.writerow(row)
+    finally:
+        text.detach()
+
+
+async def write_results_csv(session: AsyncSession, quiz_id: int, file):
+    """Итоги студентов в CSV; file - открытый на запись двоичный файл"""
+    await _write_csv(_result_rows(session, quiz_id), RESULT_COLUMNS, file)
+
+
+async def write_answers_csv(session: AsyncSession, quiz_id: int, file):
+    """Все ответы студентов в CSV; file - открытый на запись двоичный файл"""
+    await _write_csv(_answer_rows(session, quiz_id), ANSWER_COLUMNS, file)
+
+
+async def write_xlsx(session: AsyncSession, quiz_id: int, path: str, with_answers: bool):
+    """
+    Итоги и, если есть, все ответы в XLSX на двух листах.
+    Нужен пакет openpyxl; в режиме write_only строки сразу уходят во временный файл, а не копятся в памяти
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheets = [("Результаты", RESULT_COLUMNS, _result_rows(session, quiz_id))]
+    if with_answers:
+        sheets.append(("Ответы", ANSWER_COLUMNS, _answer_rows(session, quiz_id)))
+    for title, columns, rows in sheets:
+        sheet = workbook.create_sheet(title)
+        sheet.append(columns)
+        async for row in rows:
+            sheet.append(row)
+    workbook.save(path)
@@ -0,0 +1,139 @@
+# Викторина в групповом чате: каждый вопрос публикуется в чате один раз, ответы копятся и проверяются разом,
+# когда преподаватель переходит к следующему вопросу или опрос закрывается
+import time
+
+from bot import sharding
+from bot.utils import run_state
+
+# chat_id -> состояние викторины в чате; хранится в процессе, который обслуживает преподавателя:
+# {"quiz_id", "owner_id", "run_id", "question": номер текущего вопроса, "key": ключ вопроса,
+#  "message_id", "posted_at", "graded": ответы на текущий вопрос уже проверены,
+#  "scores": {user_id: правильных ответов}, "names": {user_id: имя}} - user_id строкой, как в JSON
+chats = {}
+# chat_id -> {user_id: {"options" или "text", "latency_ms"}} - ответы на текущий вопрос
+answers = {}
+# Ключ вопроса -> (chat_id, owner_id); есть во всех процессах, чтобы ответ можно было переслать владельцу.
+# Ключ опроса - poll_id, письменного вопроса - "chat_id:message_id" сообщения с вопросом
+questions = {}
+
+
+def question_key(chat_id: int, message_id: int) -> str:
+    return f"{chat_id}:{message_id}"
+
+
+async def restore():
+    """Восстанавливает викторины в чатах из хранилища состояния"""
+    for key, state in await run_state.store.items("live"):
+        chat_id = int(key)
+        if state.get("key"):
+            questions[state["key"]] = (chat_id, state["owner_id"])
+        if sharding.is_local(state["owner_id"]):
+            chats[chat_id] = state
+            answers[chat_id] = {}
+    for key, answer in await run_state.store.items("live_answers"):
+        chat_id, user_id = key.split(":")
+        if int(chat_id) in answers:
+            answers[int(chat_id)][user_id] = answer
+
+
+def start(chat_id: int, quiz_id: int, owner_id: int, run_id: int) -> dict:
+    state = chats[chat_id] = {
+        "quiz_id": quiz_id,
+        "owner_id": owner_id,
+        "run_id": run_id,
+        "question": -1,
+        "key": None,
+        "message_id": None,
+        "posted_at": None,
+        "graded": True,
+        "scores": {},
+        "names": {},
+    }
+    answers[chat_id] = {}
+    save(chat_id)
+    return state
+
+
+def save(chat_id: int):
+    run_state.store.set("live", str(chat_id), chats[chat_id])
+
+
+def question_posted(chat_id: int, question_index: int, key: str, message_id: int):
+    """Запоминает опубликованный вопрос и сообщает о нём остальным процессам"""
+    state = chats[chat_id]
+    state.update(question=question_index, key=key, message_id=message_id, posted_at=time.time(), graded=False)
+    save(chat_id)
+    questions[key] = (chat_id, state["owner_id"])
+    sharding.publish("live_question", key=key, chat_id=chat_id, owner_id=state["owner_id"])
+
+
+@sharding.on_event("live_question")
+async def _on_question(key: str, chat_id: int, owner_id: int, **kwargs):
+    questions[key] = (chat_id, owner_id)
+
+
+def record_answer(key: str, user_id: int, name: str, options: list = None, text: str = None):
+    """
+    Запоминает ответ на текущий вопрос; ответ пересылается в процесс преподавателя.
+    Пустой список options - студент отозвал голос
+    """
+    route = questions.get(key)
+    if route is None:
+        return
+    chat_id, owner_id = route
+    if not sharding.is_local(owner_id):
+        sharding.publish("live_answer", shard=sharding.shard_for(owner_id), key=key, user_id=user_id, name=name,
+                         options=options, text=text)
+        return
+
+    state = chats.get(chat_id)
+    if state is None or state["key"] != key or state["graded"]:
+        return
+    user_key = str(user_id)
+    store_key = f"{chat_id}:{user_id}"
+    if options is not None and not options:
+        answers[chat_id].pop(user_key, None)
+        run_state.store.delete("live_answers", store_key)
+        return
+    # В письменном вопросе засчитывается первый ответ
+    if text is not None and user_key in answers[chat_id]:
+        return
+    answer = answers[chat_id][user_key] = {
+        "options": options,
+        "text": text,
+        "latency_ms": int((time.time() - state["posted_at"]) * 1000),
+    }
+    state["names"][user_key] = name
+    run_state.store.set("live_answers", store_key, answer)
+
+
+@sharding.on_event("live_answer")
+async def _on_answer(key: str, user_id: int, name: str, options: list = None, text: str = None, **kwargs):
+    record_answer(key, user_id, name, options, text)
+
+
+def take_answers(chat_id: int) -> dict:
+    """Отдаёт ответы на текущий вопрос для проверки; новые ответы на него больше не принимаются"""
+    chats[chat_id]["graded"] = True
+    chat_answers = answers[chat_id]
+    answers[chat_id] = {}
+    for user_key in chat_answers:
+        run_state.store.delete("live_answers", f"{chat_id}:{user_key}")
+    return chat_answers
+
+
+def finish(chat_id: int) -> dict:
+    """Удаляет викторину из чата и возвращает её последнее состояние"""
+    state = chats.pop(chat_id)
+    answers.pop(chat_id, None)
+    run_state.store.delete("live", str(chat_id))
+    for key in [key for key, (question_chat_id, _) in questions.items() if question_chat_id == chat_id]:
+        del questions[key]
+    sharding.publish("live_finished", chat_id=chat_id)
+    return state
+
+
+@sharding.on_event("live_finished")
+async def _on_finished(chat_id: int, **kwargs):
+    for key in [key for key, (question_chat_id, _) in questions.items() if question_chat_id == chat_id]:
+        del questions[key]
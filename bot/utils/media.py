@@ -0,0 +1,78 @@
+# Реестр file_id: каждый файл загружается в Telegram один раз, дальше отправляется по file_id
+import asyncio
+import hashlib
+import os
+from functools import lru_cache
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, Message
+
+from bot.utils import run_state
+
+# Тип файла -> (метод бота, как достать file_id из отправленного сообщения)
+_KINDS = {
+    "photo": ("send_photo", lambda message: message.photo[-1].file_id),
+    "sticker": ("send_sticker", lambda message: message.sticker.file_id),
+    "document": ("send_document", lambda message: message.document.file_id),
+}
+
+# Ключ -> Future с file_id для загрузок, которые идут прямо сейчас
+_uploads = {}
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@lru_cache(maxsize=32)
+def _read_asset(path: str):
+    with open(path, "rb") as file:
+        data = file.read()
+    return content_key(data), data
+
+
+async def send(bot: Bot, chat_id: int, kind: str, key: str, load, filename: str, **kwargs) -> Message:
+    """
+    Отправляет файл по сохранённому file_id, а если его нет - загружает и запоминает file_id
+    :param kind: photo, sticker или document
+    :param key: ключ файла, обычно хэш содержимого
+    :param load: корутина без аргументов, возвращающая содержимое файла; вызывается только при загрузке
+    :param kwargs: остальные параметры метода отправки (caption и т.п.)
+    """
+    method, get_file_id = _KINDS[kind]
+    send_method = getattr(bot, method)
+    key = f"{kind}:{key}"
+
+    file_id = await run_state.store.get("media", key)
+    if file_id is None and key in _uploads:
+        # Тот же файл уже загружается для другого получателя - ждём его file_id
+        file_id = await _uploads[key]
+    if file_id is not None:
+        try:
+            return await send_method(chat_id, file_id, **kwargs)
+        except TelegramBadRequest:
+            # file_id принадлежит другому боту или устарел - загружаем заново
+            run_state.store.delete("media", key)
+
+    upload = _uploads[key] = asyncio.get_running_loop().create_future()
+    file_id = None
+    try:
+        message = await send_method(chat_id, BufferedInputFile(await load(), filename), **kwargs)
+        file_id = get_file_id(message)
+        run_state.store.set("media", key, file_id)
+        return message
+    finally:
+        # При ошибке ожидающие получат None и попробуют загрузить файл сами
+        upload.set_result(file_id)
+        _uploads.pop(key, None)
+
+
+async def send_asset(bot: Bot, chat_id: int, kind: str, path: str, **kwargs) -> Message:
+    """Отправляет локальный файл (стикер, картинку); файл читается с диска один раз"""
+    key, data = _read_asset(path)
+
+    async def load():
+        return data
+
+    return await send(bot, chat_id, kind, key, load, os.path.basename(path), **kwargs)
@@ -0,0 +1,203 @@
+# Метрики процесса в текстовом формате Prometheus: http://metrics_host:metrics_port/metrics
+import time
+from collections import defaultdict
+
+from aiohttp import web
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import Engine
+
+from bot import config, sharding
+from bot.utils import run_state, deadlines, rendering, live, outbound, startup
+
+# Границы корзин гистограмм в секундах, как у клиентов Prometheus по умолчанию
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_INF = 'le="+Inf"'
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Все метрики в порядке создания
+_registry = []
+_runner = None
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        # значения меток -> значение
+        self.values = defaultdict(float)
+        _registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] += amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.buckets = buckets
+        # значения меток -> [число наблюдений в каждой корзине (не накопительно), сумма, количество]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _labels(self.label_names, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, _INF)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """Значение считается в момент запроса метрик: read() возвращает число или {значения меток: число}"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.label_names = labels
+        _registry.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        value = self.read()
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class CounterView(Gauge):
+    """Счётчик, который ведёт другой модуль: значение, как у Gauge, читается в момент запроса метрик"""
+
+    kind = "counter"
+
+
+updates = Counter("quiz_updates_total", "Updates received, by type", ("type",))
+update_seconds = Histogram("quiz_update_seconds", "Time to process an update, by type", ("type",))
+handler_seconds = Histogram("quiz_handler_seconds", "Handler latency", ("handler",))
+handler_errors = Counter("quiz_handler_errors_total", "Exceptions raised by handlers", ("handler", "error"))
+handler_db_sessions = Counter("quiz_handler_db_sessions_total", "DB sessions opened by handlers", ("handler",))
+handler_db_queries = Counter("quiz_handler_db_queries_total", "SQL queries run by handlers", ("handler",))
+db_query_seconds = Histogram("quiz_db_query_seconds", "SQL statement execution time", ("statement",))
+bot_api_seconds = Histogram("quiz_bot_api_seconds", "Bot API call latency", ("method",))
+bot_api_errors = Counter("quiz_bot_api_errors_total", "Failed Bot API calls", ("method", "error"))
+
+Gauge("quiz_open_quizzes", "Quizzes open for joining or running in this process",
+      lambda: len(run_state.current_quizzes))
+Gauge("quiz_participants", "Participants of the open quizzes",
+      lambda: sum(len(quiz["participants"]) for quiz in run_state.current_quizzes.values()))
+Gauge("quiz_live_chats", "Group chats with a live quiz", lambda: len(live.chats))
+Gauge("quiz_pending_deadlines", "Questions waiting for their time limit", deadlines.pending)
+Gauge("quiz_render_queue", "Image rendering jobs queued or running", rendering.queue_depth)
+Gauge("quiz_outbound_queue", "Bot API sends waiting for the rate limit, by priority", outbound.queue.depth,
+      ("priority",))
+CounterView("quiz_outbound_dropped_total", "Sends dropped under load, by priority", lambda: {
+    (name,): dropped for name, dropped in zip(outbound.PRIORITY_NAMES, outbound.queue.dropped)
+}, ("priority",))
+CounterView("quiz_outbound_retries_total", "Bot API sends retried after 429 or a network error",
+            lambda: outbound.queue.retries)
+CounterView("quiz_notifications_dropped_total", "Teacher notifications dropped under load",
+            lambda: outbound.notifications_dropped)
+Gauge("quiz_startup_seconds", "Duration of each startup phase of this process",
+      lambda: {(phase,): seconds for phase, seconds in startup.phases.items()}, ("phase",))
+
+
+def _statement_kind(statement: str) -> str:
+    words = statement.split(None, 1)
+    return words[0].upper() if words else ""
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.monotonic())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    db_query_seconds.observe(time.monotonic() - started, _statement_kind(statement))
+
+
+def _on_error(context):
+    # Запрос с ошибкой не доходит до after_cursor_execute
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
+def track_queries():
+    """Замеряет время всех SQL-запросов во всех движках процесса"""
+    if not sa_event.contains(Engine, "before_cursor_execute", _before_execute):
+        sa_event.listen(Engine, "before_cursor_execute", _before_execute)
+        sa_event.listen(Engine, "after_cursor_execute", _after_execute)
+        sa_event.listen(Engine, "handle_error", _on_error)
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start():
+    global _runner
+    if config.metrics_port is None or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    # У каждого процесса-обработчика в режиме webhook свой порт
+    await web.TCPSite(_runner, config.metrics_host, config.metrics_port + sharding.shard_id).start()
+
+
+async def stop():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,251 @@
+# Все исходящие сообщения бота проходят через одну очередь с приоритетами: под нагрузкой первым уходит то,
+# чего ждёт студент, уведомления преподавателю склеиваются, а стикеры отбрасываются
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+
+from bot import config
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты, от самого важного
+QUESTION = 0  # всё, чего ждёт студент: вопрос, ответ на его сообщение
+TEACHER = 1  # уведомления и сводка для преподавателя
+DECORATION = 2  # стикеры и прочие украшения
+PRIORITY_NAMES = ("question", "teacher", "decoration")
+
+# Методы, на которые распространяются лимиты Telegram на отправку сообщений; остальные идут в обход очереди
+_LIMITED_PREFIXES = ("send", "copy", "forward", "edit", "stopPoll")
+# Лимит длины текста сообщения Telegram
+_MESSAGE_LIMIT = 4096
+
+_priority = ContextVar("outbound_priority", default=None)
+
+
+class OutboundDropped(Exception):
+    """Запрос низкого приоритета отброшен из-за перегрузки"""
+
+
+@contextmanager
+def priority(level: int):
+    """Запросы к Bot API внутри блока получают приоритет level"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboundQueue(BaseRequestMiddleware):
+    """
+    Промежуточный слой сессии бота: выдаёт запросам на отправку не больше rate разрешений в секунду,
+    в порядке приоритета, и повторяет запросы после 429 и сетевых ошибок
+    """
+
+    def __init__(self, rate: float, max_pending: tuple, max_attempts: int, decoration_max_wait: float):
+        self.rate = rate
+        # Сколько запросов каждого приоритета может ждать; остальные ждут места (стикеры - отбрасываются)
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        # Стикер, который ждал дольше, уже не нужен
+        self.decoration_max_wait = decoration_max_wait
+        self.dropped = [0] * len(PRIORITY_NAMES)
+        self.retries = 0
+        self._tokens = rate
+        self._updated = time.monotonic()
+        # По очереди на приоритет: [(время постановки, future)]
+        self._waiting = [deque() for _ in PRIORITY_NAMES]
+        self._space = [asyncio.Event() for _ in PRIORITY_NAMES]
+        self._task = None
+        # chat_id -> до какого момента Telegram попросил не писать в этот чат
+        self._chat_paused = {}
+
+    def depth(self) -> dict:
+        return {(name,): len(queue) for name, queue in zip(PRIORITY_NAMES, self._waiting)}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _next_waiter(self):
+        now = time.monotonic()
+        for level, queue in enumerate(self._waiting):
+            while queue:
+                enqueued, future = queue.popleft()
+                self._space[level].set()
+                self._space[level].clear()
+                if future.done():
+                    # Тот, кто ждал, отменён
+                    continue
+                if level == DECORATION and now - enqueued > self.decoration_max_wait:
+                    self.dropped[level] += 1
+                    future.set_exception(OutboundDropped())
+                    continue
+                return future
+        return None
+
+    async def _dispatch(self):
+        try:
+            while any(self._waiting):
+                self._refill()
+                if self._tokens < 1:
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+                    continue
+                future = self._next_waiter()
+                if future is not None:
+                    self._tokens -= 1
+                    future.set_result(None)
+        finally:
+            self._task = None
+
+    async def _acquire(self, level: int):
+        if not any(self._waiting):
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+        queue = self._waiting[level]
+        if level == DECORATION and (len(queue) >= self.max_pending[level] or any(self._waiting[:level])):
+            self.dropped[level] += 1
+            raise OutboundDropped()
+        while len(queue) >= self.max_pending[level]:
+            await self._space[level].wait()
+        future = asyncio.get_running_loop().create_future()
+        queue.append((time.monotonic(), future))
+        if self._task is None:
+            self._task = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _wait_chat(self, chat_id):
+        until = self._chat_paused.get(chat_id)
+        if until is None:
+            return
+        delay = until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif self._chat_paused.get(chat_id) == until:
+            del self._chat_paused[chat_id]
+
+    def _pause_chat(self, chat_id, retry_after: float):
+        # Не даём словарю расти бесконечно: выбрасываем чаты, пауза которых уже закончилась
+        if len(self._chat_paused) >= 10000:
+            now = time.monotonic()
+            for paused_chat_id in [c for c, until in self._chat_paused.items() if until <= now]:
+                del self._chat_paused[paused_chat_id]
+        until = time.monotonic() + retry_after
+        self._chat_paused[chat_id] = max(self._chat_paused.get(chat_id, 0.0), until)
+
+    async def __call__(self, make_request, bot: Bot, method):
+        name = method.__api_method__
+        if not name.startswith(_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+        level = _priority.get()
+        if level is None:
+            level = DECORATION if name == "sendSticker" else QUESTION
+        chat_id = getattr(method, "chat_id", None)
+
+        for attempt in range(1, self.max_attempts + 1):
+            await self._wait_chat(chat_id)
+            await self._acquire(level)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                # Общий лимит бота соблюдает сама очередь, поэтому 429 - это лимит чата: ждёт только он
+                self._pause_chat(chat_id, e.retry_after)
+                logger.warning("Flood control for chat %s, retry after %s s", chat_id, e.retry_after)
+                if level == DECORATION:
+                    self.dropped[level] += 1
+                    raise OutboundDropped() from e
+                if attempt == self.max_attempts:
+                    raise
+                self.retries += 1
+            except (TelegramNetworkError, TelegramServerError):
+                if attempt == self.max_attempts:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(min(2 ** attempt * 0.5, 10))
+
+
+queue = OutboundQueue(
+    rate=config.outbound_rate,
+    max_pending=(config.outbound_max_questions, config.outbound_max_teacher, config.outbound_max_decorations),
+    max_attempts=config.outbound_max_attempts,
+    decoration_max_wait=config.outbound_decoration_max_wait,
+)
+
+
+async def decoration(coro):
+    """Отправляет украшение (стикер): под нагрузкой оно отбрасывается, и тогда возвращается None"""
+    with priority(DECORATION):
+        try:
+            return await coro
+        except OutboundDropped:
+            return None
+
+
+# chat_id -> тексты уведомлений, ещё не отправленные преподавателю
+_notifications = {}
+# chat_id -> задача, которая их отправит
+_notify_tasks = {}
+notifications_dropped = 0
+
+
+def notify(bot: Bot, chat_id: int, text: str):
+    """
+    Уведомление преподавателю без ожидания отправки. Уведомления, накопившиеся за notify_interval,
+    уходят одним сообщением; если их больше notify_max_pending, самые старые отбрасываются
+    """
+    global notifications_dropped
+    pending = _notifications.setdefault(chat_id, deque())
+    pending.append(text)
+    if len(pending) > config.notify_max_pending:
+        pending.popleft()
+        notifications_dropped += 1
+    if chat_id not in _notify_tasks:
+        _notify_tasks[chat_id] = asyncio.create_task(_deliver(bot, chat_id))
+
+
+def _merge(texts) -> list:
+    """Склеивает тексты в сообщения не длиннее лимита Telegram, не разрывая отдельные уведомления"""
+    messages = []
+    current = ""
+    for text in texts:
+        if current and len(current) + 1 + len(text) > _MESSAGE_LIMIT:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{text}" if current else text[:_MESSAGE_LIMIT]
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def _deliver(bot: Bot, chat_id: int):
+    try:
+        while _notifications.get(chat_id):
+            await asyncio.sleep(config.notify_interval)
+            texts = _notifications.pop(chat_id)
+            await _send_notifications(bot, chat_id, texts)
+    finally:
+        _notify_tasks.pop(chat_id, None)
+
+
+async def _send_notifications(bot: Bot, chat_id: int, texts):
+    with priority(TEACHER):
+        for text in _merge(texts):
+            try:
+                await bot.send_message(chat_id, text, disable_web_page_preview=True)
+            except Exception as e:
+                logger.warning("Failed to notify %s: %r", chat_id, e)
+
+
+async def stop():
+    """Дожидается отправки накопившихся уведомлений"""
+    await asyncio.gather(*_notify_tasks.values(), return_exceptions=True)
@@ -1,12 +1,29 @@
+# qrcode и Pillow импортируются внутри функций отрисовки: рисуют процессы пула (bot.utils.rendering),
+# а основной процесс бота их не загружает и запускается быстрее
+import hashlib
 import io
-import qrcode
-from qrcode.image.styledpil import StyledPilImage
-from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
-from qrcode.image.styles.colormasks import SolidFillColorMask
-from PIL import Image, ImageDraw
+from collections import OrderedDict
+from functools import lru_cache
+
+from bot import config
+from bot.utils import rendering
+
+# Оформление QR-кода; входит в ключ кэша, поэтому при его изменении коды перерисуются
+QR_STYLE = {
+    "box_size": 20,
+    "border": 1,  # Толщина границы QR-кода
+    "back_color": (255, 255, 255),
+    "front_color": (89, 173, 209),  # Голубой цвет
+    "logo": "logo.png",
+}
+
+# Ключ -> PNG, порядок элементов - порядок использования
+_png_cache = OrderedDict()
 
 
 def add_rounded_corners(image, radius):
+    from PIL import Image, ImageDraw
+
     # Создаем маску с закругленными углами
     mask = Image.new('L', image.size, 0)
     draw = ImageDraw.Draw(mask)
@@ -19,12 +36,34 @@ def add_rounded_corners(image, radius):
     return rounded_image
 
 
-def generate_qr_code(data, id):
+@lru_cache(maxsize=8)
+def load_logo(path: str, size: int):
+    """Открывает логотип и уменьшает его один раз для каждого размера"""
+    from PIL import Image
+
+    logo = Image.open(path)
+    if logo.mode != 'RGBA':
+        logo = logo.convert('RGBA')
+    return logo.resize((size, size), Image.Resampling.LANCZOS)
+
+
+def qr_key(data: str) -> str:
+    """Ключ QR-кода: хэш содержимого вместе с оформлением"""
+    style = repr(sorted(QR_STYLE.items()))
+    return hashlib.sha256(f"{data}\n{style}".encode()).hexdigest()
+
+
+def generate_qr_code(data):
+    import qrcode
+    from qrcode.image.styledpil import StyledPilImage
+    from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
+    from qrcode.image.styles.colormasks import SolidFillColorMask
+
     qr = qrcode.QRCode(
         version=1,  # Версия QR-кода
         error_correction=qrcode.constants.ERROR_CORRECT_H,  # Высокая коррекция ошибок
-        box_size=20,
-        border=1,  # Толщина границы QR-кода
+        box_size=QR_STYLE["box_size"],
+        border=QR_STYLE["border"],
     )
 
     # Добавляем данные (ссылку) в QR-код
@@ -35,17 +74,13 @@ def generate_qr_code(data, id):
     img_qr = qr.make_image(
         image_factory=StyledPilImage,
         module_drawer=RoundedModuleDrawer(),  # Закругленные модули
-        color_mask=SolidFillColorMask(back_color=(255, 255, 255), front_color=(89, 173, 209))  # Голубой цвет
+        color_mask=SolidFillColorMask(back_color=QR_STYLE["back_color"], front_color=QR_STYLE["front_color"])
     )
 
-    # Открываем логотип
-    logo = Image.open('logo.png')  # Замените 'logo.jpg' на ваш файл логотипа
-    if logo.mode != 'RGBA':
-        logo = logo.convert('RGBA')
-    # Изменяем размер логотипа под QR-код (логотип займет примерно 1/4 часть QR-кода)
+    # Логотип займет примерно 1/4 часть QR-кода
     qr_size = img_qr.size
     logo_size = qr_size[0] // 4
-    logo = logo.resize((logo_size, logo_size), Image.Resampling.LANCZOS)
+    logo = load_logo(QR_STYLE["logo"], logo_size)
 
     # Вычисляем позицию для логотипа (центр QR-кода)
     logo_position = (
@@ -55,15 +90,34 @@ def generate_qr_code(data, id):
 
     # Вставляем логотип в центр QR-кода
     img_qr.paste(logo, logo_position, mask=logo)  # Вставляем логотип с использованием маски для прозрачности
-
-    # Сохраняем итоговое изображение
-    img_qr.save(f'qr_{id}.png')
     return img_qr
 
 
+def render_qr_code_png(data: str) -> bytes:
+    output = io.BytesIO()
+    generate_qr_code(data).save(output, format='PNG')
+    return output.getvalue()
+
+
+async def qr_code_png(data: str) -> bytes:
+    """Возвращает QR-код в PNG; одинаковые ссылки рисуются только один раз и в пуле процессов"""
+    key = qr_key(data)
+    png = _png_cache.get(key)
+    if png is not None:
+        _png_cache.move_to_end(key)
+        return png
+
+    png = _png_cache[key] = await rendering.run(render_qr_code_png, data)
+    while len(_png_cache) > config.qr_cache_size:
+        _png_cache.popitem(last=False)
+    return png
+
+
 def create_qr_code_png(data: str, logo_path: str = None):
+    from PIL import Image
+
     # Генерируем QR-код
-    qr_image = generate_qr_code(data, box_size=20, border=1)
+    qr_image = generate_qr_code(data)
 
     # Добавляем закругленные углы к QR-коду
     radius = 20  # Радиус закругления углов
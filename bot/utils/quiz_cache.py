@@ -0,0 +1,115 @@
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot import config
+from bot.db import Quiz
+from bot.db import questions as question_repository
+from bot.utils.answer_matcher import AnswerMatcher
+
+
+class CompiledQuestion:
+    """Вопрос с заранее подготовленным правильным ответом"""
+
+    def __init__(self, data: dict):
+        self.data = data
+        # Для вопросов с выбором - множество правильных вариантов, для письменных - разобранные правильные ответы
+        if data["type"] == "multiple_choice":
+            self.correct_options = frozenset(data["correct"])
+            self.matcher = None
+        else:
+            self.correct_options = None
+            self.matcher = AnswerMatcher(data["correct"])
+
+    def is_correct_text(self, text) -> bool:
+        # Текст в ответ на вопрос с выбором (например, запоздавший ответ на прошлый вопрос) - неверный ответ,
+        # как и сообщение без текста (стикер, фото, голосовое)
+        return self.matcher is not None and text is not None and self.matcher.match(text)
+
+
+class CompiledQuiz:
+    """Викторина, вопросы которой читаются из базы по одному, когда они понадобятся впервые"""
+
+    def __init__(self, quiz: Quiz):
+        self.quiz_id = quiz.id
+        self.name = quiz.name
+        self.owner_id = quiz.user_id
+        self.question_count = quiz.question_count
+        # номер вопроса -> CompiledQuestion
+        self._questions = {}
+
+    def __len__(self):
+        return self.question_count
+
+    async def question(self, session: AsyncSession, index: int):
+        """Возвращает вопрос номер index (с нуля) или None"""
+        compiled = self._questions.get(index)
+        if compiled is None:
+            data = await question_repository.get_question(session, self.quiz_id, index)
+            if data is None:
+                return None
+            compiled = self._questions[index] = CompiledQuestion(data)
+        return compiled
+
+    async def load_questions(self, session: AsyncSession):
+        """Читает и разбирает сразу все вопросы одним запросом"""
+        for index, data in enumerate(await question_repository.get_questions(session, self.quiz_id)):
+            if index not in self._questions:
+                self._questions[index] = CompiledQuestion(data)
+
+
+# quiz_id -> (время добавления, CompiledQuiz), порядок элементов - порядок использования
+_cache = OrderedDict()
+
+
+def put(quiz: Quiz) -> CompiledQuiz:
+    """Разбирает викторину и кладёт её в кэш"""
+    compiled = CompiledQuiz(quiz)
+    _cache[quiz.id] = (time.monotonic(), compiled)
+    _cache.move_to_end(quiz.id)
+    while len(_cache) > config.quiz_cache_size:
+        _cache.popitem(last=False)
+    return compiled
+
+
+def get(quiz_id: int):
+    """Возвращает разобранную викторину из кэша или None"""
+    entry = _cache.get(quiz_id)
+    if entry is None:
+        return None
+    added_at, compiled = entry
+    if time.monotonic() - added_at > config.quiz_cache_ttl:
+        _cache.pop(quiz_id)
+        return None
+    _cache.move_to_end(quiz_id)
+    return compiled
+
+
+async def load(session: AsyncSession, quiz_id: int):
+    """Возвращает викторину из кэша, при промахе читает её из базы"""
+    compiled = get(quiz_id)
+    if compiled is None:
+        quiz = await session.get(Quiz, quiz_id)
+        if quiz is None:
+            return None
+        compiled = put(quiz)
+    return compiled
+
+
+def invalidate(quiz_id: int):
+    _cache.pop(quiz_id, None)
+
+
+async def prewarm(session: AsyncSession, quiz_ids) -> int:
+    """
+    Разбирает заранее, вместе со всеми вопросами, открытые викторины и викторины quiz_ids,
+    чтобы первые ответы после перезапуска не ждали базу. Возвращает число викторин
+    """
+    query = select(Quiz).where(or_(Quiz.active.is_(True), Quiz.id.in_(list(quiz_ids)))) \
+        .order_by(Quiz.id.desc()).limit(config.quiz_cache_size)
+    quizzes = (await session.execute(query)).scalars().all()
+    for quiz in quizzes:
+        await put(quiz).load_questions(session)
+    return len(quizzes)
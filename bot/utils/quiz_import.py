@@ -0,0 +1,408 @@
+import csv
+import io
+import itertools
+import json
+import re
+
+from bot.utils.answer_matcher import ANSWER_SEPARATOR
+
+# Ограничения Telegram для опросов
+MAX_QUESTION_LENGTH = 300
+MAX_OPTION_LENGTH = 100
+MIN_OPTIONS = 2
+MAX_OPTIONS = 10
+# Время на ответ в секундах (open_period опроса)
+MIN_TIME_LIMIT = 5
+MAX_TIME_LIMIT = 600
+# JSON читается кусками такого размера; одно значение (вопрос) не может быть длиннее JSON_MAX_VALUE_SIZE символов
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_MAX_VALUE_SIZE = 1024 * 1024
+
+_json_decoder = json.JSONDecoder()
+
+
+def validate_question(data) -> dict:
+    """
+    Проверяет вопрос и приводит его к виду, который сохраняет создание викторины в диалоге
+    :param data: словарь с полями type, question, options, correct (номера правильных вариантов с нуля)
+        и необязательными photo (file_id картинки) и time_limit (секунд на ответ)
+    :return: {"type", "question", "options", "correct"} и "photo", "time_limit", если они заданы
+    """
+    if not isinstance(data, dict):
+        raise ValueError("вопрос должен быть объектом")
+
+    question_type = data.get("type")
+    question = data.get("question")
+    options = data.get("options") or []
+    correct = data.get("correct")
+
+    if not isinstance(question, str) or not question.strip():
+        raise ValueError("нет текста вопроса")
+    question = question.strip()
+
+    if question_type == "multiple_choice":
+        if len(question) > MAX_QUESTION_LENGTH:
+            raise ValueError(f"текст вопроса длиннее {MAX_QUESTION_LENGTH} символов")
+        if not isinstance(options, list) or not all(isinstance(option, str) for option in options):
+            raise ValueError("варианты ответа должны быть списком строк")
+        options = [option.strip() for option in options]
+        if not MIN_OPTIONS <= len(options) <= MAX_OPTIONS:
+            raise ValueError(f"вариантов ответа должно быть от {MIN_OPTIONS} до {MAX_OPTIONS}")
+        if any(not option or len(option) > MAX_OPTION_LENGTH for option in options):
+            raise ValueError(f"вариант ответа пустой или длиннее {MAX_OPTION_LENGTH} символов")
+        # bool - подкласс int: true и false не номера вариантов
+        if isinstance(correct, int) and not isinstance(correct, bool):
+            correct = [correct]
+        if not isinstance(correct, list) or not correct or \
+                not all(isinstance(i, int) and not isinstance(i, bool) and 0 <= i < len(options) for i in correct):
+            raise ValueError("неверные номера правильных ответов")
+        correct = sorted(set(correct))
+    elif question_type == "written":
+        # Несколько допустимых ответов можно передать списком
+        if isinstance(correct, list) and all(isinstance(answer, str) for answer in correct):
+            correct = f"{ANSWER_SEPARATOR} ".join(answer.strip() for answer in correct if answer.strip())
+        if not isinstance(correct, str) or not correct.strip(ANSWER_SEPARATOR + " "):
+            raise ValueError("нет правильного ответа")
+        options = []
+        correct = correct.strip()
+    else:
+        raise ValueError("тип вопроса должен быть multiple_choice или written")
+
+    result = {
+        "type": question_type,
+        "question": question,
+        "options": options,
+        "correct": correct
+    }
+    photo = data.get("photo")
+    if photo is not None:
+        if not isinstance(photo, str) or not photo.strip():
+            raise ValueError("photo должен быть file_id картинки")
+        result["photo"] = photo.strip()
+    time_limit = data.get("time_limit")
+    if time_limit:
+        if not isinstance(time_limit, int) or not MIN_TIME_LIMIT <= time_limit <= MAX_TIME_LIMIT:
+            raise ValueError(f"time_limit должен быть целым числом от {MIN_TIME_LIMIT} до {MAX_TIME_LIMIT} секунд")
+        result["time_limit"] = time_limit
+    return result
+
+
+def parse_json_lines(lines):
+    """JSON Lines: по одному вопросу в каждой строке"""
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, ValueError("строка не является JSON")
+
+
+class QuizName(str):
+    """Название викторины, указанное в самом файле; разборщик отдаёт его вместо вопроса"""
+
+
+class _JsonStream:
+    """Чтение JSON по частям: значения разбираются по одному, файл целиком в память не загружается"""
+
+    def __init__(self, text):
+        self.text = text
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.text.read(JSON_CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Следующий символ после пробелов или "" в конце файла"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"ожидается {char}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _json_decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                end = None
+            # Значение в конце буфера может быть обрезано ("12" из "123"), поэтому дочитываем файл
+            if end is not None and (end < len(self.buffer) or self.eof):
+                self.pos = end
+                return value
+            if len(self.buffer) - self.pos > JSON_MAX_VALUE_SIZE:
+                raise ValueError(f"значение длиннее {JSON_MAX_VALUE_SIZE} символов")
+            if not self._fill():
+                if end is not None:
+                    self.pos = end
+                    return value
+                raise ValueError("ошибка в JSON")
+
+    def items(self, close: str):
+        """Перебирает элементы массива или объекта до закрывающей скобки close"""
+        if self.peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == close:
+                return
+            if char != ",":
+                raise ValueError(f"ожидается , или {close}")
+
+
+def _json_questions(stream: _JsonStream):
+    stream.expect("[")
+    for number, _ in enumerate(stream.items("]"), 1):
+        yield number, stream.value()
+
+
+def parse_json(text):
+    """
+    Обычный JSON: {"name": ..., "questions": [...]} или просто список вопросов.
+    Читается потоком, как и остальные форматы: в памяти одновременно только один вопрос
+    """
+    stream = _JsonStream(text)
+    try:
+        if stream.peek() == "[":
+            yield from _json_questions(stream)
+        elif stream.peek() == "{":
+            stream.pos += 1
+            has_questions = False
+            for _ in stream.items("}"):
+                key = stream.value()
+                stream.expect(":")
+                if key == "questions" and stream.peek() == "[":
+                    has_questions = True
+                    yield from _json_questions(stream)
+                elif key == "name" and stream.peek() == "\"":
+                    yield 0, QuizName(stream.value())
+                else:
+                    stream.value()
+            if not has_questions:
+                yield 0, ValueError("в файле нет списка вопросов")
+        else:
+            yield 0, ValueError("в файле нет списка вопросов")
+            return
+        # Как json.loads, не принимаем ничего после основного значения
+        if stream.peek():
+            raise ValueError("лишние данные после конца JSON")
+    except UnicodeDecodeError:
+        # read_questions попробует другую кодировку
+        raise
+    except ValueError as e:
+        yield 0, ValueError(f"файл не является корректным JSON: {e}")
+
+
+def parse_csv(lines):
+    """
+    CSV: вопрос, варианты через ";", номера правильных вариантов через ";" (с единицы).
+    Если вариантов нет - вопрос с письменным ответом, а в третьем столбце правильный ответ
+    """
+    lines = iter(lines)
+    first_line = next(lines, "")
+    dialect = csv.excel_tab if "\t" in first_line else csv.excel
+
+    reader = csv.reader(itertools.chain([first_line], lines), dialect)
+    for row in reader:
+        line_number = reader.line_num
+        if not any(cell.strip() for cell in row):
+            continue
+        if line_number == 1 and [cell.strip().lower() for cell in row[:3]] == ["question", "options", "correct"]:
+            continue
+        if len(row) < 3:
+            yield line_number, ValueError("нужно три столбца: вопрос, варианты, правильный ответ")
+            continue
+        question, options, correct = row[0], row[1], row[2]
+        if options.strip():
+            try:
+                correct = [int(answer.strip()) - 1 for answer in correct.split(";")]
+            except ValueError:
+                yield line_number, ValueError("номера правильных ответов должны быть числами")
+                continue
+            yield line_number, {
+                "type": "multiple_choice",
+                "question": question,
+                "options": options.split(";"),
+                "correct": correct
+            }
+        else:
+            yield line_number, {"type": "written", "question": question, "correct": correct}
+
+
+_GIFT_TITLE = re.compile(r"^::(.*?)::", re.DOTALL)
+_GIFT_ANSWERS = re.compile(r"(?<!\\)\{(.*)(?<!\\)\}", re.DOTALL)
+_GIFT_FORMAT = re.compile(r"^\[(html|plain|markdown|moodle)\]")
+_GIFT_WEIGHT = re.compile(r"^%(-?\d+(?:\.\d+)?)%")
+
+
+def _gift_unescape(text: str) -> str:
+    return re.sub(r"\\(.)", lambda match: "\n" if match.group(1) == "n" else match.group(1), text).strip()
+
+
+def _format_number(value: float) -> str:
+    # Без экспоненты: "1e+06" не разобрать как число при проверке ответа
+    return f"{value:f}".rstrip("0").rstrip(".")
+
+
+def _parse_gift_number(body: str):
+    """Числовой ответ GIFT "3.14:0.01" или "3..4" в виде "3.14 ± 0.01" для проверки письменного ответа"""
+    body = re.split(r"(?<!\\)#", body.lstrip("= "))[0].strip()
+    try:
+        if ".." in body:
+            low, high = (float(value) for value in body.split(".."))
+            return f"{_format_number((low + high) / 2)} ± {_format_number((high - low) / 2)}"
+        value, _, tolerance = body.partition(":")
+        return f"{_format_number(float(value))} ± {_format_number(float(tolerance or 0))}"
+    except ValueError:
+        return None
+
+
+def _parse_gift_block(text: str):
+    text = _GIFT_TITLE.sub("", text).strip()
+    match = _GIFT_ANSWERS.search(text)
+    if match is None:
+        return ValueError("нет блока ответов {...}")
+    question = _gift_unescape(_GIFT_FORMAT.sub("", text[:match.start()] + " " + text[match.end():]).strip())
+    body = match.group(1).strip()
+
+    if body.upper() in ("T", "TRUE", "F", "FALSE"):
+        return {
+            "type": "multiple_choice",
+            "question": question,
+            "options": ["Верно", "Неверно"],
+            "correct": [0] if body.upper().startswith("T") else [1]
+        }
+    if body.startswith("#"):
+        correct = _parse_gift_number(body[1:])
+        if correct is None:
+            return ValueError("неверный числовой ответ")
+        return {"type": "written", "question": question, "correct": correct}
+
+    # Разбиваем на ответы по неэкранированным ~ и =
+    parts = re.split(r"(?<!\\)([~=])", body)
+    if parts[0].strip():
+        return ValueError("ответ должен начинаться с = или ~")
+    answers = []
+    for marker, answer in zip(parts[1::2], parts[2::2]):
+        # Отзыв после # не нужен
+        answer = re.split(r"(?<!\\)#", answer)[0].strip()
+        if "->" in answer:
+            return ValueError("вопросы на сопоставление GIFT не поддерживаются")
+        weight = _GIFT_WEIGHT.match(answer)
+        if weight:
+            answer = answer[weight.end():]
+            is_correct = float(weight.group(1)) > 0
+        else:
+            is_correct = marker == "="
+        answers.append((marker, _gift_unescape(answer), is_correct))
+
+    if answers and all(marker == "=" for marker, _, _ in answers):
+        # Только правильные ответы - вопрос с письменным ответом
+        return {"type": "written", "question": question,
+                "correct": f"{ANSWER_SEPARATOR} ".join(answer for _, answer, _ in answers)}
+    return {
+        "type": "multiple_choice",
+        "question": question,
+        "options": [answer for _, answer, _ in answers],
+        "correct": [i for i, (_, _, is_correct) in enumerate(answers) if is_correct]
+    }
+
+
+def parse_gift(lines):
+    """Moodle GIFT: вопросы разделены пустыми строками, ответы в {...}"""
+    block = []
+    start = 0
+    for line_number, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if stripped.startswith("//") or stripped.startswith("$CATEGORY"):
+            continue
+        if not stripped:
+            if block:
+                yield start, _parse_gift_block("\n".join(block))
+                block = []
+            continue
+        if not block:
+            start = line_number
+        block.append(stripped)
+    if block:
+        yield start, _parse_gift_block("\n".join(block))
+
+
+# Расширение файла -> разборщик
+PARSERS = {
+    ".json": parse_json,
+    ".jsonl": parse_json_lines,
+    ".csv": parse_csv,
+    ".gift": parse_gift,
+    ".txt": parse_gift,
+}
+
+
+def _read_questions(lines, parser, max_questions: int, max_errors: int):
+    name = None
+    questions = []
+    errors = []
+    error_count = 0
+    for number, item in parser(lines):
+        if isinstance(item, QuizName):
+            name = item.strip() or None
+            continue
+        if not isinstance(item, Exception):
+            try:
+                item = validate_question(item)
+            except ValueError as e:
+                item = e
+        if isinstance(item, Exception):
+            error_count += 1
+            if len(errors) < max_errors:
+                errors.append(f"{number}: {item}" if number else str(item))
+            continue
+        if len(questions) >= max_questions:
+            errors.append(f"в файле больше {max_questions} вопросов")
+            error_count += 1
+            break
+        questions.append(item)
+    if error_count > len(errors):
+        errors.append(f"и ещё ошибок: {error_count - len(errors)}")
+    return name, questions, errors
+
+
+def read_questions(file, extension: str, max_questions: int, max_errors: int = 20):
+    """
+    Построчно читает вопросы из файла и проверяет каждый. Работает синхронно, поэтому из обработчиков
+    вызывается в пуле потоков
+    :param file: открытый на чтение двоичный файл
+    :param extension: расширение файла из PARSERS
+    :return: (название викторины из файла или None, вопросы, список ошибок)
+    """
+    parser = PARSERS[extension]
+    # Excel сохраняет CSV в cp1251, поэтому при ошибке декодирования читаем файл ещё раз
+    for encoding in ("utf-8-sig", "cp1251"):
+        file.seek(0)
+        text = io.TextIOWrapper(file, encoding=encoding, newline="")
+        try:
+            return _read_questions(text, parser, max_questions, max_errors)
+        except UnicodeDecodeError:
+            continue
+        finally:
+            text.detach()
+    return None, [], ["не удалось определить кодировку файла, сохраните его в UTF-8"]
@@ -0,0 +1,85 @@
+# Пул процессов для работы с изображениями, чтобы PIL не останавливал обработку обновлений
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_semaphore = None
+
+# Счётчики для метрик
+stats = {
+    "queued": 0,  # ждут свободного места в пуле
+    "running": 0,  # переданы в пул
+    "completed": 0,
+    "failed": 0,
+    "total_seconds": 0.0,
+}
+
+
+def _warm_up():
+    """Выполняется в каждом процессе пула: импортирует библиотеки и загружает логотип"""
+    from bot.utils.qrcode_api import generate_qr_code
+    # Ссылка той же длины, что и приглашения, чтобы логотип уменьшился до нужного размера
+    generate_qr_code("https://t.me/" + "x" * 20 + "?start=" + "x" * 12)
+
+
+def start(workers: int, max_pending: int):
+    """
+    Запускает пул
+    :param workers: число процессов
+    :param max_pending: сколько задач может одновременно находиться в пуле, остальные ждут
+    """
+    global _executor, _semaphore
+    if _executor is not None:
+        return
+    _executor = ProcessPoolExecutor(max_workers=workers, initializer=_warm_up)
+    _semaphore = asyncio.Semaphore(max_pending)
+    # Процессы создаются при первой задаче, поэтому сразу запускаем их все
+    for _ in range(workers):
+        _executor.submit(time.sleep, 0)
+
+
+def stop():
+    global _executor, _semaphore
+    if _executor is None:
+        return
+    _executor.shutdown(wait=True, cancel_futures=True)
+    _executor = None
+    _semaphore = None
+
+
+def queue_depth() -> int:
+    return stats["queued"] + stats["running"]
+
+
+async def run(func, *args):
+    """
+    Выполняет func(*args) в пуле процессов; func и аргументы должны передаваться через pickle.
+    Если пул не запущен, выполняет в потоке
+    """
+    loop = asyncio.get_running_loop()
+    if _executor is None:
+        return await loop.run_in_executor(None, func, *args)
+
+    stats["queued"] += 1
+    try:
+        await _semaphore.acquire()
+    finally:
+        stats["queued"] -= 1
+
+    stats["running"] += 1
+    started = time.monotonic()
+    try:
+        result = await loop.run_in_executor(_executor, func, *args)
+    except Exception:
+        stats["failed"] += 1
+        raise
+    finally:
+        stats["running"] -= 1
+        stats["total_seconds"] += time.monotonic() - started
+        _semaphore.release()
+    stats["completed"] += 1
+    return result
@@ -0,0 +1,47 @@
+# Индексы для маршрутизации ответов без перебора всех викторин
+
+# user_id -> quiz_id
+participant_quizzes = {}
+
+# poll_id -> (quiz_id, user_id, question_index)
+poll_routes = {}
+
+# user_id -> set(poll_id), чтобы чистить опросы пользователя после завершения
+user_polls = {}
+
+
+def add_participant(quiz_id: int, user_id: int):
+    """Привязывает пользователя к викторине"""
+    remove_participant(user_id)
+    participant_quizzes[user_id] = quiz_id
+
+
+def get_participant_quiz(user_id: int):
+    """Возвращает quiz_id викторины, в которой участвует пользователь, или None"""
+    return participant_quizzes.get(user_id)
+
+
+def register_poll(poll_id: str, quiz_id: int, user_id: int, question_index: int):
+    """Запоминает, к какому вопросу какой викторины относится опрос"""
+    poll_routes[poll_id] = (quiz_id, user_id, question_index)
+    user_polls.setdefault(user_id, set()).add(poll_id)
+
+
+def get_poll_route(poll_id: str):
+    """Возвращает (quiz_id, user_id, question_index) для опроса или None"""
+    return poll_routes.get(poll_id)
+
+
+def forget_poll(poll_id: str):
+    route = poll_routes.pop(poll_id, None)
+    if route is not None:
+        polls = user_polls.get(route[1])
+        if polls is not None:
+            polls.discard(poll_id)
+
+
+def remove_participant(user_id: int):
+    """Отвязывает пользователя от викторины (например, после её завершения)"""
+    participant_quizzes.pop(user_id, None)
+    for poll_id in user_polls.pop(user_id, ()):
+        poll_routes.pop(poll_id, None)
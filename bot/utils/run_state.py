@@ -0,0 +1,232 @@
+# Состояние идущих викторин: в памяти для быстрых ответов, копия - в StateStore на случай перезапуска
+import asyncio
+import itertools
+import logging
+import time
+
+from bot import config, sharding
+from bot.storage import StateStore, MemoryStateStore
+from bot.utils import routing, deadlines
+
+# quiz_id -> {"run_id": int, "participants": {user_id: {"current_question": int, "correct_answers": int}}};
+# у участника с ограничением времени на текущий вопрос есть ещё "deadline" - time.time() окончания срока
+current_quizzes = {}
+# user_id -> черновик викторины, которую пользователь создаёт в диалоге
+temporary_quiz_data = {}
+# user_id -> имя и группа, которые студент ввёл при входе в викторину
+usernames = {}
+# user_id -> time.monotonic() отправки текущего вопроса; после перезапуска не восстанавливается
+question_sent_at = {}
+
+store: StateStore = MemoryStateStore()
+
+logger = logging.getLogger(__name__)
+
+# id запроса числа участников -> (future, {номер процесса: число его участников})
+_count_requests = {}
+_count_request_ids = itertools.count(1)
+
+
+async def restore(state_store: StateStore):
+    """Подключает хранилище и восстанавливает из него идущие викторины"""
+    global store
+    store = state_store
+
+    for key, value in await store.items("quizzes"):
+        quiz_data = current_quizzes.setdefault(int(key), {"participants": {}})
+        if isinstance(value, dict):
+            quiz_data["run_id"] = value.get("run_id")
+
+    # При нескольких процессах каждый восстанавливает только своих пользователей
+    for key, participant in await store.items("participants"):
+        quiz_id, user_id = map(int, key.split(":"))
+        if not sharding.is_local(user_id):
+            continue
+        if quiz_id not in current_quizzes:
+            store.delete("participants", key)
+            continue
+        current_quizzes[quiz_id]["participants"][user_id] = participant
+        routing.add_participant(quiz_id, user_id)
+        # Срок, истёкший за время перезапуска, сработает сразу после запуска таймера
+        if participant.get("deadline"):
+            deadlines.schedule(user_id, quiz_id, participant["current_question"], participant["deadline"])
+
+    for poll_id, (quiz_id, user_id, question_index) in await store.items("polls"):
+        if not sharding.is_local(user_id):
+            continue
+        if routing.get_participant_quiz(user_id) != quiz_id:
+            store.delete("polls", poll_id)
+            continue
+        routing.register_poll(poll_id, quiz_id, user_id, question_index)
+
+    for key, name in await store.items("usernames"):
+        if sharding.is_local(int(key)):
+            usernames[int(key)] = name
+
+    for key, draft in await store.items("drafts"):
+        if sharding.is_local(int(key)):
+            temporary_quiz_data[int(key)] = draft
+
+
+def open_quiz(quiz_id: int):
+    """Открывает викторину для входа участников"""
+    if quiz_id not in current_quizzes:
+        current_quizzes[quiz_id] = {"participants": {}}
+        store.set("quizzes", str(quiz_id), True)
+    return current_quizzes[quiz_id]
+
+
+def start_run(quiz_id: int, run_id: int):
+    """Запоминает проведение викторины, к которому относятся ответы участников"""
+    open_quiz(quiz_id)["run_id"] = run_id
+    store.set("quizzes", str(quiz_id), {"run_id": run_id})
+
+
+def close_quiz(quiz_id: int):
+    """Удаляет викторину вместе с участниками и их опросами"""
+    quiz_data = current_quizzes.pop(quiz_id, None)
+    if quiz_data is None:
+        return
+    for user_id in quiz_data["participants"]:
+        _forget_participant(quiz_id, user_id)
+    store.delete("quizzes", str(quiz_id))
+
+
+def _local_count(quiz_id: int) -> int:
+    return len(current_quizzes.get(quiz_id, {}).get("participants", {}))
+
+
+async def count_participants(quiz_id: int) -> int:
+    """
+    Число участников викторины во всех процессах. Свежие данные об участниках есть только в памяти
+    их процесса, поэтому остальные процессы отвечают через события; участников процесса, который
+    не ответил за shard_reply_timeout, считаем по хранилищу
+    """
+    count = _local_count(quiz_id)
+    if sharding.shard_count == 1:
+        return count
+    request_id = next(_count_request_ids)
+    done = asyncio.get_running_loop().create_future()
+    replies = {}
+    _count_requests[request_id] = (done, replies)
+    try:
+        sharding.publish("count_participants", quiz_id=quiz_id, reply_to=sharding.shard_id, request_id=request_id)
+        await asyncio.wait_for(done, config.shard_reply_timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        del _count_requests[request_id]
+
+    missing = set(range(sharding.shard_count)) - set(replies) - {sharding.shard_id}
+    if missing:
+        logger.warning("Shards %s did not report participants of quiz %s", sorted(missing), quiz_id)
+        prefix = f"{quiz_id}:"
+        count += sum(1 for key in await store.keys("participants", prefix)
+                     if sharding.shard_for(int(key[len(prefix):])) in missing)
+    return count + sum(replies.values())
+
+
+@sharding.on_event("count_participants")
+async def _on_count_participants(quiz_id: int, reply_to: int, request_id: int, **kwargs):
+    sharding.publish("participants_counted", shard=reply_to, request_id=request_id,
+                     from_shard=sharding.shard_id, count=_local_count(quiz_id))
+
+
+@sharding.on_event("participants_counted")
+async def _on_participants_counted(request_id: int, from_shard: int, count: int, **kwargs):
+    request = _count_requests.get(request_id)
+    # Ответ опоздал: участников этого процесса уже посчитали по хранилищу
+    if request is None:
+        return
+    done, replies = request
+    replies[from_shard] = count
+    if len(replies) == sharding.shard_count - 1 and not done.done():
+        done.set_result(None)
+
+
+def add_participant(quiz_id: int, user_id: int) -> dict:
+    """Добавляет студента в викторину; студент может участвовать только в одной викторине одновременно"""
+    previous_quiz_id = routing.get_participant_quiz(user_id)
+    if previous_quiz_id is not None and previous_quiz_id != quiz_id:
+        remove_participant(previous_quiz_id, user_id)
+
+    participant = open_quiz(quiz_id)["participants"][user_id] = {
+        "current_question": 0,
+        "correct_answers": 0
+    }
+    routing.add_participant(quiz_id, user_id)
+    save_participant(quiz_id, user_id)
+    return participant
+
+
+def save_participant(quiz_id: int, user_id: int):
+    """Сохраняет прогресс участника после изменения"""
+    store.set("participants", f"{quiz_id}:{user_id}", current_quizzes[quiz_id]["participants"][user_id])
+
+
+def remove_participant(quiz_id: int, user_id: int):
+    quiz_data = current_quizzes.get(quiz_id)
+    if quiz_data is not None:
+        quiz_data["participants"].pop(user_id, None)
+    _forget_participant(quiz_id, user_id)
+
+
+def _forget_participant(quiz_id: int, user_id: int):
+    question_sent_at.pop(user_id, None)
+    deadlines.cancel(user_id)
+    for poll_id in routing.user_polls.get(user_id, ()):
+        store.delete("polls", poll_id)
+    if routing.get_participant_quiz(user_id) == quiz_id:
+        routing.remove_participant(user_id)
+    store.delete("participants", f"{quiz_id}:{user_id}")
+
+
+def register_poll(poll_id: str, quiz_id: int, user_id: int, question_index: int):
+    routing.register_poll(poll_id, quiz_id, user_id, question_index)
+    store.set("polls", poll_id, [quiz_id, user_id, question_index])
+
+
+def mark_question_sent(user_id: int):
+    question_sent_at[user_id] = time.monotonic()
+
+
+def answer_latency_ms(user_id: int):
+    """Время с отправки текущего вопроса в миллисекундах или None, если оно неизвестно"""
+    sent_at = question_sent_at.pop(user_id, None)
+    if sent_at is None:
+        return None
+    return int((time.monotonic() - sent_at) * 1000)
+
+
+def set_deadline(quiz_id: int, user_id: int, seconds: float):
+    """Назначает срок ответа на текущий вопрос участника"""
+    participant = current_quizzes[quiz_id]["participants"][user_id]
+    participant["deadline"] = time.time() + seconds
+    save_participant(quiz_id, user_id)
+    deadlines.schedule(user_id, quiz_id, participant["current_question"], participant["deadline"])
+
+
+def clear_deadline(quiz_id: int, user_id: int):
+    """Снимает срок ответа; сохраняется вместе со следующим изменением прогресса участника"""
+    current_quizzes[quiz_id]["participants"][user_id].pop("deadline", None)
+    deadlines.cancel(user_id)
+
+
+def forget_poll(poll_id: str):
+    routing.forget_poll(poll_id)
+    store.delete("polls", poll_id)
+
+
+def set_username(user_id: int, name: str):
+    usernames[user_id] = name
+    store.set("usernames", str(user_id), name)
+
+
+def save_draft(user_id: int):
+    """Сохраняет черновик викторины после изменения"""
+    store.set("drafts", str(user_id), temporary_quiz_data[user_id])
+
+
+def clear_draft(user_id: int):
+    temporary_quiz_data.pop(user_id, None)
+    store.delete("drafts", str(user_id))
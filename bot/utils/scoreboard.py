@@ -0,0 +1,172 @@
+import asyncio
+import html
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from bot import config, sharding
+from bot.utils import outbound
+
+logger = logging.getLogger(__name__)
+
+# Викторины, для которых преподаватель включил уведомления о каждом ответе
+verbose_quizzes = set()
+
+
+class Scoreboard:
+    """Закреплённое у преподавателя сообщение со сводкой по идущей викторине"""
+
+    def __init__(self, bot: Bot, quiz_id: int, quiz_name: str, owner_id: int, total_questions: int,
+                 participants: int):
+        self.bot = bot
+        self.quiz_id = quiz_id
+        self.quiz_name = quiz_name
+        self.owner_id = owner_id
+        self.participants = participants
+        self.finished = 0
+        self.correct = [0] * total_questions
+        self.incorrect = [0] * total_questions
+        self.message_id = None
+        self.running = True
+        self._flush_task = None
+
+    def render(self) -> str:
+        status = "идёт" if self.running else "остановлена"
+        lines = [
+            f"<b>{html.escape(self.quiz_name or '')}</b>: {status}",
+            f"Участников: {self.participants}, закончили: {self.finished}",
+        ]
+        length = sum(len(line) for line in lines)
+        for i, (correct, incorrect) in enumerate(zip(self.correct, self.incorrect)):
+            line = f"Вопрос {i + 1}: ✅ {correct} ❌ {incorrect}"
+            # Не выходим за лимит длины сообщения Telegram
+            length += len(line) + 1
+            if length > 4000:
+                lines.append("…")
+                break
+            lines.append(line)
+        return "\n".join(lines)
+
+    async def publish(self):
+        with outbound.priority(outbound.TEACHER):
+            message = await self.bot.send_message(self.owner_id, self.render())
+        self.message_id = message.message_id
+        try:
+            await self.bot.pin_chat_message(self.owner_id, self.message_id, disable_notification=True)
+        except TelegramBadRequest:
+            pass
+
+    def record_answer(self, question_index: int, correct: bool):
+        if correct:
+            self.correct[question_index] += 1
+        else:
+            self.incorrect[question_index] += 1
+        self.schedule_flush()
+
+    def record_finish(self):
+        self.finished += 1
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        # Все изменения за интервал попадают в одно редактирование сообщения
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(config.scoreboard_interval)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if self.message_id is None:
+            return
+        try:
+            # Сводка важна меньше, чем вопросы студентам
+            with outbound.priority(outbound.TEACHER):
+                await self.bot.edit_message_text(self.render(), chat_id=self.owner_id, message_id=self.message_id)
+        except TelegramBadRequest:
+            # Сообщение не изменилось или было удалено
+            pass
+        except Exception as e:
+            logger.warning("Failed to update scoreboard for quiz %s: %r", self.quiz_id, e)
+
+    async def close(self):
+        self.running = False
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if self.message_id is None:
+            return
+        try:
+            await self.bot.unpin_chat_message(self.owner_id, message_id=self.message_id)
+        except TelegramBadRequest:
+            pass
+
+
+# quiz_id -> Scoreboard
+scoreboards = {}
+
+
+async def open_scoreboard(bot: Bot, quiz_id: int, quiz_name: str, owner_id: int, total_questions: int,
+                          participants: int) -> Scoreboard:
+    await close_scoreboard(quiz_id)
+    scoreboard = scoreboards[quiz_id] = Scoreboard(bot, quiz_id, quiz_name, owner_id, total_questions, participants)
+    await scoreboard.publish()
+    return scoreboard
+
+
+def get_scoreboard(quiz_id: int):
+    return scoreboards.get(quiz_id)
+
+
+async def close_scoreboard(quiz_id: int):
+    scoreboard = scoreboards.pop(quiz_id, None)
+    if scoreboard is not None:
+        await scoreboard.close()
+
+
+# Сводка живёт в процессе, который обрабатывает преподавателя; остальные процессы пересылают ему ответы
+def record_answer(owner_id: int, quiz_id: int, question_index: int, correct: bool):
+    if not sharding.is_local(owner_id):
+        sharding.publish("scoreboard_answer", shard=sharding.shard_for(owner_id), owner_id=owner_id,
+                         quiz_id=quiz_id, question_index=question_index, correct=correct)
+        return
+    scoreboard = scoreboards.get(quiz_id)
+    if scoreboard is not None:
+        scoreboard.record_answer(question_index, correct)
+
+
+def record_finish(owner_id: int, quiz_id: int):
+    if not sharding.is_local(owner_id):
+        sharding.publish("scoreboard_finish", shard=sharding.shard_for(owner_id), owner_id=owner_id,
+                         quiz_id=quiz_id)
+        return
+    scoreboard = scoreboards.get(quiz_id)
+    if scoreboard is not None:
+        scoreboard.record_finish()
+
+
+def set_verbose(quiz_id: int, enabled: bool, publish: bool = True):
+    if enabled:
+        verbose_quizzes.add(quiz_id)
+    else:
+        verbose_quizzes.discard(quiz_id)
+    if publish:
+        sharding.publish("scoreboard_verbose", quiz_id=quiz_id, enabled=enabled)
+
+
+@sharding.on_event("scoreboard_answer")
+async def _on_answer(owner_id: int, quiz_id: int, question_index: int, correct: bool, **kwargs):
+    record_answer(owner_id, quiz_id, question_index, correct)
+
+
+@sharding.on_event("scoreboard_finish")
+async def _on_finish(owner_id: int, quiz_id: int, **kwargs):
+    record_finish(owner_id, quiz_id)
+
+
+@sharding.on_event("scoreboard_verbose")
+async def _on_verbose(quiz_id: int, enabled: bool, **kwargs):
+    set_verbose(quiz_id, enabled, publish=False)
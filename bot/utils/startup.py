@@ -0,0 +1,27 @@
+# Время запуска по этапам: после падения во время экзамена каждая секунда перезапуска - потерянное время ответов
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Начало отсчёта - импорт этого модуля, поэтому bot.__main__ импортирует его первым
+_started = time.monotonic()
+_last_mark = _started
+# Этап -> длительность в секундах, в порядке прохождения
+phases = {}
+
+
+def mark(phase: str):
+    """Этап phase закончился сейчас; он длился с конца предыдущего этапа"""
+    global _last_mark
+    now = time.monotonic()
+    phases[phase] = phases.get(phase, 0.0) + now - _last_mark
+    _last_mark = now
+
+
+def report(phase: str):
+    """Отмечает конец последнего этапа phase и пишет в лог, сколько занял запуск и каждый его этап"""
+    mark(phase)
+    total = time.monotonic() - _started
+    logger.info("Started in %.2f s: %s", total, ", ".join(f"{name} {seconds:.2f} s"
+                                                          for name, seconds in phases.items()))
@@ -0,0 +1,100 @@
+# Отчёт по результатам викторины: сортировка и группировка в SQL, вывод по страницам
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.db.models import Stat
+
+# Лимит Telegram на длину сообщения с запасом под заголовок
+MAX_PAGE_LENGTH = 3800
+
+_ORDER = (Stat.group_number, Stat.display_name, Stat.id)
+
+
+def parse_participant_name(text: str):
+    """'Иван Иванов 5406' -> ('Иван Иванов', 5406); без номера группы - (text, 0)"""
+    words = (text or "").split()
+    if len(words) > 1 and words[-1].isdigit():
+        return " ".join(words[:-1]), int(words[-1])
+    return " ".join(words), 0
+
+
+class StatsPage:
+    def __init__(self, rows, has_prev: bool, has_next: bool, groups=None):
+        self.rows = rows
+        self.has_prev = has_prev
+        self.has_next = has_next
+        # [(группа, участников, средний результат, вопросов)] - только для первой страницы
+        self.groups = groups
+
+    @property
+    def first_id(self):
+        return self.rows[0].id if self.rows else 0
+
+    @property
+    def last_id(self):
+        return self.rows[-1].id if self.rows else 0
+
+
+async def group_summary(session: AsyncSession, quiz_id: int):
+    query = select(
+        Stat.group_number, func.count(Stat.id), func.avg(Stat.correct_count), func.max(Stat.total_questions)
+    ).where(Stat.quiz_id == quiz_id).group_by(Stat.group_number).order_by(Stat.group_number)
+    return (await session.execute(query)).all()
+
+
+async def fetch_page(session: AsyncSession, quiz_id: int, page_size: int, after_id: int = 0,
+                     before_id: int = 0) -> StatsPage:
+    """
+    Возвращает страницу отчёта; страницы отсчитываются от строки, а не по OFFSET
+    :param after_id: id последней строки предыдущей страницы (кнопка "дальше")
+    :param before_id: id первой строки следующей страницы (кнопка "назад")
+    """
+    query = select(Stat).filter_by(quiz_id=quiz_id)
+    anchor = await session.get(Stat, after_id or before_id) if after_id or before_id else None
+    if anchor is not None:
+        anchor_key = tuple_(anchor.group_number, anchor.display_name, anchor.id)
+        query = query.where(tuple_(*_ORDER) > anchor_key if after_id else tuple_(*_ORDER) < anchor_key)
+
+    backwards = anchor is not None and bool(before_id)
+    order = [column.desc() for column in _ORDER] if backwards else list(_ORDER)
+    rows = list((await session.execute(query.order_by(*order).limit(page_size + 1))).scalars())
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if backwards:
+        rows.reverse()
+        return StatsPage(rows, has_prev=has_more, has_next=True)
+    page = StatsPage(rows, has_prev=anchor is not None, has_next=has_more)
+    if anchor is None:
+        page.groups = await group_summary(session, quiz_id)
+    return page
+
+
+def render_page(page: StatsPage) -> str:
+    """Текст страницы; строки, которые не помещаются в сообщение, переносятся на следующую страницу"""
+    lines = []
+    if page.groups and len(page.groups) > 1:
+        for group_number, count, average, total in page.groups:
+            group = f"Группа {group_number}" if group_number else "Без группы"
+            lines.append(f"{group}: {count} уч., в среднем {average or 0:.1f} из {total or 0}")
+        lines.append("")
+
+    length = sum(len(line) + 1 for line in lines)
+    current_group = None
+    for i, stat in enumerate(page.rows):
+        row_lines = []
+        if stat.group_number != current_group:
+            current_group = stat.group_number
+            row_lines.append(f"<b>Группа {current_group}</b>" if current_group else "<b>Без группы</b>")
+        row_lines.append(f"{stat.name} правильных ответов: {stat.correct_count} из {stat.total_questions}")
+        row_length = sum(len(line) + 1 for line in row_lines)
+        if i and length + row_length > MAX_PAGE_LENGTH:
+            page.rows = page.rows[:i]
+            page.has_next = True
+            break
+        lines.extend(row_lines)
+        length += row_length
+
+    if not page.rows:
+        return "Результатов пока нет."
+    return "\n".join(lines)
@@ -0,0 +1,118 @@
+# Импортируется первым: отсюда отсчитывается время импорта в отчёте о запуске
+from bot.utils import startup
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+from aiogram import Dispatcher
+from aiohttp import web
+
+from bot import config, sharding
+from bot.app import create_bot, create_dispatcher, include_routers
+from bot.db.engine import create_sessionmaker, dispose
+from bot.storage import SqliteStateStore
+from bot.ui_commands import set_ui_commands
+from bot.utils import outbound, run_state
+
+logger = logging.getLogger(__name__)
+
+
+def create_front_app(inboxes: list) -> web.Application:
+    """Принимает обновления от Telegram и раздаёт их процессам по id пользователя"""
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if config.webhook_secret and \
+                request.headers.get("X-Telegram-Bot-Api-Secret-Token") != config.webhook_secret:
+            return web.Response(status=401)
+        update = await request.json()
+        # Все обновления одного пользователя попадают в один процесс, где лежат его FSM и прогресс
+        inboxes[sharding.update_owner(update) % len(inboxes)].put_nowait({"update": update})
+        return web.Response()
+
+    async def on_startup(app: web.Application):
+        bot = create_bot()
+        # Список типов обновлений берём у диспетчера с теми же обработчиками, что в процессах-обработчиках
+        dp = Dispatcher()
+        include_routers(dp)
+        # Хэш последних установленных команд хранится в том же хранилище состояния, что у процессов-обработчиков
+        sessionmaker = None
+        if config.state_backend == "sqlite":
+            sessionmaker = create_sessionmaker()
+            run_state.store = SqliteStateStore(sessionmaker, config.state_flush_interval, config.state_cache_size)
+            await run_state.store.start()
+        await set_ui_commands(bot)
+        if sessionmaker is not None:
+            await run_state.store.close()
+            await dispose(sessionmaker)
+        await bot.set_webhook(
+            config.webhook_url + config.webhook_path,
+            secret_token=config.webhook_secret or None,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        await bot.session.close()
+
+    app = web.Application()
+    app.router.add_post(config.webhook_path, handle_update)
+    app.on_startup.append(on_startup)
+    return app
+
+
+async def _worker_main(shard_id: int, inboxes: list):
+    startup.mark("import")
+    sharding.configure(shard_id, inboxes)
+    # Лимит Telegram общий для бота, поэтому делим его между процессами
+    outbound.queue.rate = config.outbound_rate / len(inboxes)
+
+    bot = create_bot()
+    dp = await create_dispatcher()
+    await dp.emit_startup(bot=bot, dispatcher=dp, **dp.workflow_data)
+    startup.report("hooks")
+
+    loop = asyncio.get_running_loop()
+    inbox = inboxes[shard_id]
+    tasks = set()
+    try:
+        while True:
+            item = await loop.run_in_executor(None, inbox.get)
+            if item is None:
+                break
+            if "update" in item:
+                coro = dp.feed_raw_update(bot, item["update"])
+            else:
+                coro = sharding.handle_event(item, bot=bot, **dp.workflow_data)
+            task = asyncio.create_task(coro)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, **dp.workflow_data)
+        await bot.session.close()
+
+
+def run_worker(shard_id: int, inboxes: list):
+    # Остановкой процессов управляет основной процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if os.name == "nt":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_worker_main(shard_id, inboxes))
+
+
+def run_webhook():
+    logging.basicConfig(level=logging.INFO)
+    inboxes = [multiprocessing.Queue() for _ in range(config.webhook_workers)]
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(shard_id, inboxes), name=f"quiz-worker-{shard_id}")
+        for shard_id in range(config.webhook_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        web.run_app(create_front_app(inboxes), host=config.webhook_host, port=config.webhook_port)
+    finally:
+        for inbox in inboxes:
+            inbox.put(None)
+        for worker in workers:
+            worker.join()